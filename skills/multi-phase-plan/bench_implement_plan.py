@@ -0,0 +1,218 @@
+# /// script
+# dependencies = [
+#   "claude-agent-sdk",
+#   "dicttoxml",
+#   "pygments",
+# ]
+# ///
+
+"""
+Benchmark implement_plan.py's orchestration overhead offline.
+
+Generates a plan with N subphases and runs the real run_agent loop against
+fake_client.FakeClaudeSDKClient, rendering to /dev/null. Reports messages
+rendered per second, per-iteration scheduling latency (gap between one
+session ending and the next starting) and RSS growth across iterations.
+
+Usage:
+    uv run bench_implement_plan.py --iterations 1000 --output results.json
+    uv run bench_implement_plan.py --iterations 200 --concurrency 4 --render pretty
+    uv run bench_implement_plan.py --replay transcripts/1.2.jsonl
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import implement_plan
+from fake_client import FakeClaudeSDKClient, FakeConfig
+
+
+def write_plan(path: Path, subphases: int, width: int, gated: bool):
+    """A plan of `subphases` subphases, `width` per phase, each phase optionally gated on the previous one."""
+    lines = ["<plan>"]
+    for p in range((subphases + width - 1) // width):
+        lines.append(f'  <phase id="p{p}">')
+        if gated and p:
+            lines.append(f'    <gates><gate_element id="p{p - 1}"/></gates>')
+        for i in range(p * width, min((p + 1) * width, subphases)):
+            lines.append(f'    <phase id="s{i}" status="pending"/>')
+        lines.append("  </phase>")
+    lines.append("</plan>")
+    path.write_text("\n".join(lines) + "\n")
+
+
+def current_rss_mb() -> float:
+    """Resident set size now (Linux), falling back to the peak elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def bench(args, workdir: Path) -> dict:
+    plan = workdir / "plan.xml"
+    write_plan(plan, args.iterations, args.width, args.gated)
+
+    spans: list[tuple[float, float]] = []
+    rss: list[tuple[int, float]] = [(0, current_rss_mb())]
+    config = FakeConfig(messages=args.messages, size=args.size, rate=args.rate, replay=args.replay)
+
+    def on_complete(subphase: str, plan_path: str):
+        implement_plan.set_subphase_status(plan_path, subphase, "completed")
+        if config.started % args.sample_every == 0:
+            rss.append((config.started, current_rss_mb()))
+
+    config.on_complete = on_complete
+
+    class TimedClient(FakeClaudeSDKClient):
+        async def __aenter__(self):
+            self.entered = time.perf_counter()
+            return self
+
+        async def __aexit__(self, *exc):
+            spans.append((self.entered, time.perf_counter()))
+            return False
+
+    rendered = 0
+
+    class CountingRenderer(implement_plan.Renderer):
+        def render(self, message, label=None):
+            nonlocal rendered
+            rendered += 1
+            super().render(message, label)
+
+    devnull = open(os.devnull, "w")
+    implement_plan.CLIENT_FACTORY = lambda options: TimedClient(options, config)
+    implement_plan.OUTPUT = implement_plan.OutputWriter(
+        CountingRenderer(args.render, devnull), args.output_buffer, args.output_policy
+    )
+    implement_plan.CHECKPOINTS = implement_plan.Checkpoints(str(workdir / "checkpoints.json"))
+    if args.transcripts:
+        implement_plan.TRANSCRIPTS = implement_plan.TranscriptLog(str(workdir / "transcripts"))
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(devnull):  # run_agent's progress lines
+        await implement_plan.run_agent(
+            lambda subphase, plan_path: implement_plan.get_prompt(plan_path, subphase),
+            str(plan),
+            concurrency=args.concurrency,
+            watch_interval=args.watch_interval,
+        )
+    await implement_plan.OUTPUT.close()
+    if implement_plan.TRANSCRIPTS:
+        await implement_plan.TRANSCRIPTS.close()
+    wall = time.perf_counter() - start
+    devnull.close()
+    rss.append((config.started, current_rss_mb()))
+
+    # Scheduling latency: for each session start, the time since the latest earlier session end
+    ends = sorted(end for _, end in spans)
+    gaps = []
+    for begin, _ in sorted(spans)[1:]:
+        earlier = [end for end in ends if end <= begin]
+        if earlier:
+            gaps.append((begin - earlier[-1]) * 1000)
+
+    return {
+        "iterations": config.started,
+        "wall_seconds": wall,
+        "messages_rendered": rendered,
+        "messages_per_second": rendered / wall if wall else 0.0,
+        "iterations_per_second": config.started / wall if wall else 0.0,
+        "scheduling_latency_ms": {
+            "median": statistics.median(gaps) if gaps else 0.0,
+            "p95": percentile(gaps, 0.95) if gaps else 0.0,
+            "max": max(gaps, default=0.0),
+        },
+        "rss_mb": {
+            "start": rss[0][1],
+            "end": rss[-1][1],
+            "growth": rss[-1][1] - rss[0][1],
+            "samples": [{"iteration": i, "rss_mb": round(mb, 2)} for i, mb in rss],
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark implement_plan.py orchestration with a fake SDK client")
+    parser.add_argument("--iterations", "-n", type=int, default=1000, help="Subphases (= agent sessions) to run (default: 1000)")
+    parser.add_argument("--width", type=int, default=10, help="Subphases per phase (default: 10)")
+    parser.add_argument("--gated", action="store_true", help="Gate each phase on the previous one")
+    parser.add_argument("--concurrency", "-j", type=int, default=1, help="Sessions at once (default: 1)")
+    parser.add_argument("--messages", type=int, default=20, help="Tool round trips per synthesized session (default: 20)")
+    parser.add_argument("--size", type=int, default=2000, help="Characters of tool output per round trip (default: 2000)")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.0,
+        help="Fake messages/sec, or replay speed-up factor (default: 0 = no delays)"
+    )
+    parser.add_argument("--replay", default=None, help="Replay sessions from a transcript instead of synthesizing")
+    parser.add_argument(
+        "--render",
+        choices=["pretty", "xml", "jsonl"],
+        default="xml",
+        help="implement_plan --output format to render with (default: xml)"
+    )
+    parser.add_argument("--output-buffer", type=int, default=1000, help="Output queue size (default: 1000)")
+    parser.add_argument(
+        "--output-policy",
+        choices=["block", "drop", "summarize"],
+        default="block",
+        help="Output queue policy; block renders every message (default: block)"
+    )
+    parser.add_argument("--transcripts", action="store_true", help="Also write JSONL transcripts")
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=0.25,
+        help="run_agent's plan-file polling interval (default: 0.25)"
+    )
+    parser.add_argument("--sample-every", type=int, default=100, help="Sample RSS every N iterations (default: 100)")
+    parser.add_argument("--output", "-o", default=None, help="Write results JSON here (default: stdout)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-implement-plan-") as workdir:
+        result = asyncio.run(bench(args, Path(workdir)))
+
+    print(
+        f"{result['iterations']} iterations in {result['wall_seconds']:.2f}s: "
+        f"{result['messages_per_second']:.0f} msg/s rendered, "
+        f"scheduling latency median {result['scheduling_latency_ms']['median']:.2f} ms, "
+        f"RSS {result['rss_mb']['start']:.1f} -> {result['rss_mb']['end']:.1f} MiB",
+        file=sys.stderr
+    )
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        **result,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# /// script
+# dependencies = [
+#   "claude-agent-sdk",
+# ]
+# ///
+
+"""
+Offline stand-in for claude_agent_sdk.ClaudeSDKClient.
+
+FakeClaudeSDKClient has the same async-context / query / receive_response
+interface and either replays sessions from a transcript written by
+implement_plan.py --transcript-dir, or synthesizes sessions with a
+configurable number of messages, tool-output size and message rate.
+
+Used by implement_plan.py --backend fake and by bench_implement_plan.py.
+"""
+
+import asyncio
+import gzip
+import io
+import json
+import re
+import time
+import uuid
+from dataclasses import dataclass, field, fields
+from typing import Any, AsyncIterator, Callable
+
+from claude_agent_sdk import (
+    AssistantMessage,
+    ClaudeAgentOptions,
+    ResultMessage,
+    SystemMessage,
+    TextBlock,
+    ThinkingBlock,
+    ToolResultBlock,
+    ToolUseBlock,
+    UserMessage,
+)
+
+MESSAGE_TYPES = {cls.__name__: cls for cls in (AssistantMessage, ResultMessage, SystemMessage, UserMessage)}
+PROMPT_TARGET = re.compile(r'id="([^"]+)" in (\S+?)\.(?:\s|$)')
+
+
+@dataclass
+class FakeConfig:
+    """How fake sessions behave.
+
+    messages: tool-call round trips per synthesized session
+    size: characters of tool output per round trip
+    rate: messages per second (0 = as fast as possible); for replay, a
+        speed-up factor over the recorded timing (0 = no delays)
+    replay: transcript (.jsonl, .jsonl.gz or .jsonl.zst) whose sessions are replayed in turn
+    on_complete: called as on_complete(subphase_id, plan_path) when a session ends,
+        standing in for the agent marking its subphase completed
+    """
+
+    messages: int = 20
+    size: int = 2000
+    rate: float = 0.0
+    replay: str | None = None
+    on_complete: Callable[[str, str], None] | None = None
+    sessions: list[list[tuple[float, Any]]] = field(default_factory=list, repr=False)
+    started: int = 0
+
+
+def read_transcript(path: str) -> list[list[tuple[float, Any]]]:
+    """Split a transcript into sessions of (t, message) pairs."""
+    if path.endswith(".gz"):
+        f = gzip.open(path, "rt", encoding="utf-8")
+    elif path.endswith(".zst"):
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+        f = io.TextIOWrapper(reader, encoding="utf-8")
+    else:
+        f = open(path, encoding="utf-8")
+
+    sessions, current = [], []
+    with f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get("type") == "Iteration":
+                if current:
+                    sessions.append(current)
+                current = []
+            elif entry.get("type") in MESSAGE_TYPES:
+                current.append((entry.pop("t", 0.0), message_from_dict(entry)))
+    if current:
+        sessions.append(current)
+    if not sessions:
+        raise ValueError(f"No sessions in transcript: {path}")
+    return sessions
+
+
+def block_from_dict(d: dict) -> Any:
+    """Transcripts don't record block types; tell them apart by their fields."""
+    if "tool_use_id" in d:
+        return ToolResultBlock(**d)
+    if "name" in d and "input" in d:
+        return ToolUseBlock(**d)
+    if "thinking" in d:
+        return ThinkingBlock(thinking=d["thinking"], signature=d.get("signature", ""))
+    if "text" in d:
+        return TextBlock(**d)
+    return d
+
+
+def message_from_dict(d: dict) -> Any:
+    cls = MESSAGE_TYPES[d.pop("type")]
+    known = {f.name for f in fields(cls)}
+    kwargs = {k: v for k, v in d.items() if k in known}
+    if cls in (AssistantMessage, UserMessage) and isinstance(kwargs.get("content"), list):
+        kwargs["content"] = [block_from_dict(b) if isinstance(b, dict) else b for b in kwargs["content"]]
+    if cls is AssistantMessage:
+        kwargs.setdefault("model", "fake")
+    return cls(**kwargs)
+
+
+def synthesize_session(config: FakeConfig, session_id: str) -> list[tuple[float, Any]]:
+    """An init message, `messages` tool round trips and a ResultMessage, spaced at `rate`."""
+    step = 1 / config.rate if config.rate else 0.0
+    line = "x" * 79 + "\n"
+    output = (line * (config.size // len(line) + 1))[:config.size]
+    stream = [SystemMessage(subtype="init", data={"session_id": session_id, "model": "fake"})]
+    for i in range(config.messages):
+        tool_id = f"toolu_{i}"
+        stream.append(AssistantMessage(
+            content=[
+                TextBlock(text=f"Looking at file {i}."),
+                ToolUseBlock(id=tool_id, name="Read", input={"file_path": f"src/module_{i}.py"}),
+            ],
+            model="fake",
+        ))
+        stream.append(UserMessage(content=[ToolResultBlock(tool_use_id=tool_id, content=output)]))
+    stream.append(ResultMessage(
+        subtype="success",
+        duration_ms=int(step * 1000 * (2 * config.messages + 1)),
+        duration_api_ms=0,
+        is_error=False,
+        num_turns=config.messages + 1,
+        session_id=session_id,
+        total_cost_usd=0.0,
+        usage={"input_tokens": config.size * config.messages // 4, "output_tokens": 20 * config.messages},
+        result="done",
+    ))
+    return [(i * step, message) for i, message in enumerate(stream)]
+
+
+class FakeClaudeSDKClient:
+    """Drop-in for ClaudeSDKClient that never touches the network."""
+
+    def __init__(self, options: ClaudeAgentOptions | None = None, config: FakeConfig | None = None):
+        self.options = options
+        self.config = config or FakeConfig()
+        self.prompt = ""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def query(self, prompt: str | AsyncIterator[dict[str, Any]]):
+        if isinstance(prompt, str):
+            self.prompt = prompt
+        else:
+            async for message in prompt:
+                self.prompt = message["message"]["content"]
+
+    async def receive_response(self) -> AsyncIterator[Any]:
+        config = self.config
+        session_id = (self.options and self.options.resume) or str(uuid.uuid4())
+        if config.replay:
+            if not config.sessions:
+                config.sessions = read_transcript(config.replay)
+            stream = config.sessions[config.started % len(config.sessions)]
+            speed = config.rate
+        else:
+            stream = synthesize_session(config, session_id)
+            speed = 1.0
+        config.started += 1
+
+        start = time.perf_counter()
+        for t, message in stream:
+            if speed:
+                delay = t / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            yield message
+
+        target = PROMPT_TARGET.search(self.prompt)
+        if config.on_complete and target:
+            config.on_complete(*target.groups())
+
+
+def fake_client_factory(config: FakeConfig) -> Callable[[ClaudeAgentOptions], FakeClaudeSDKClient]:
+    """A ClaudeSDKClient-compatible constructor bound to `config`."""
+    return lambda options: FakeClaudeSDKClient(options, config)
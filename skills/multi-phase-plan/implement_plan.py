@@ -14,18 +14,35 @@ from claude_agent_sdk import (
     SystemMessage,
     ResultMessage,
     PermissionResultAllow,
+    RateLimitEvent,
     ToolPermissionContext,
+    ToolUseBlock,
 )
 import argparse
 import asyncio
+import fcntl
+import gzip
+import hashlib
+import io
 import os
+import queue
+import re
+import shutil
+import sys
+import textwrap
+import threading
+import time
 import xml.etree.ElementTree as ET
-from dataclasses import asdict
+from collections import Counter, deque
+from dataclasses import asdict, fields, is_dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, AsyncIterator
+from typing import Any, AsyncIterator, Callable
 
 import json
 from xml.dom.minidom import parseString
+from xml.sax.saxutils import escape, quoteattr
 
 import dicttoxml
 from pygments import highlight
@@ -44,17 +61,15 @@ enchourage them to search using rg+wc for general terms iterativly and narrow do
 
 
 
+@lru_cache(maxsize=None)
 def get_terminal_size() -> tuple[int, int]:
-    """Get terminal size (lines, columns)."""
-    import shutil
+    """Get terminal size (lines, columns), queried once per run."""
     size = shutil.get_terminal_size()
     return size.lines, size.columns
 
 
 def truncate_value(value: Any, max_lines: int, wrap_width: int) -> Any:
     """Wrap and truncate a string value if it exceeds max_lines."""
-    import textwrap
-
     if isinstance(value, str):
         # Wrap each line to terminal width
         wrapped_lines = []
@@ -98,34 +113,615 @@ def safe_asdict(obj, truncate: bool = False) -> dict:
     return json.loads(json.dumps(d, default=str))
 
 
-def dict_to_pretty_xml(data: dict) -> str:
+def dict_to_pretty_xml(data: dict, colorize: bool = True) -> str:
     """Convert a dict to pretty-printed XML with syntax highlighting, filtering out null fields."""
     filtered = filter_null_fields(data)
     xml = dicttoxml.dicttoxml(filtered, attr_type=False)
     dom = parseString(xml)
     pretty_xml = dom.toprettyxml(indent='  ')
+    if not colorize:
+        return pretty_xml
     return highlight(pretty_xml, XmlLexer(), TerminalFormatter())
 
+
+def to_plain(value: Any, truncate: Callable[[str], str] | None = None) -> Any:
+    """Convert message dataclasses to dicts/lists/scalars, dropping None fields.
+
+    Strings are passed through `truncate` on the way, so long tool output is
+    cut before anything is serialized.
+    """
+    if is_dataclass(value) and not isinstance(value, type):
+        value = {f.name: getattr(value, f.name) for f in fields(value)}
+    if isinstance(value, dict):
+        return {str(k): to_plain(v, truncate) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v, truncate) for v in value]
+    if isinstance(value, str):
+        return truncate(value) if truncate else value
+    if isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
+
+
+XML_NAME = re.compile(r"^[A-Za-z_][\w.-]*$")
+
+
+class Renderer:
+    """Writes agent messages to a stream in the --output format.
+
+    pretty: the dicttoxml/minidom/Pygments pipeline (highlighted on a TTY only).
+    xml: the same layout, streamed element by element without building a DOM.
+    jsonl: one JSON object per message, streamed with iterencode.
+
+    xml and jsonl walk the message dataclasses directly, dropping None fields
+    and truncating long strings (UserMessage tool output) before anything is
+    serialized.
+    """
+
+    def __init__(self, output: str = "pretty", stream=None):
+        self.output = output
+        self.stream = stream or sys.stdout
+        lines, cols = get_terminal_size()
+        self.max_lines = max(5, lines // 3)
+        self.wrap_width = max(40, cols - 10)  # Leave margin for XML indentation
+        self.colorize = self.stream.isatty()
+        self.json_encoder = json.JSONEncoder(default=str)
+
+    def render(self, message, label: str | None = None):
+        truncate = isinstance(message, UserMessage)
+        if self.output == "pretty":
+            d = {"type": type(message).__name__, **safe_asdict(message, truncate=truncate)}
+            if label:
+                print(f"[{label}]", file=self.stream)
+            print(dict_to_pretty_xml(d, colorize=self.colorize), file=self.stream)
+            return
+
+        data = {"type": type(message).__name__, **to_plain(message, self.truncate if truncate else None)}
+        if self.output == "jsonl":
+            if label:
+                data = {"subphase": label, **data}
+            for chunk in self.json_encoder.iterencode(data):
+                self.stream.write(chunk)
+            self.stream.write("\n")
+        else:
+            if label:
+                self.stream.write(f"[{label}]\n")
+            self.write_xml("root", data, 0)
+        self.stream.flush()
+
+    def note(self, text: str):
+        """Write a line that is not an agent message (e.g. skipped-output tallies)."""
+        if self.output == "jsonl":
+            self.stream.write(json.dumps({"type": "OutputNote", "text": text}) + "\n")
+        else:
+            self.stream.write(f"[output] {text}\n")
+        self.stream.flush()
+
+    def status(self, text: str):
+        """Write an orchestrator progress line (iterations, merges, retries)."""
+        if self.output == "jsonl":
+            self.stream.write(json.dumps({"type": "Status", "text": text}) + "\n")
+        else:
+            self.stream.write(text + "\n")
+        self.stream.flush()
+
+    def truncate(self, text: str) -> str:
+        """Keep the first max_lines lines, touching only the kept part of the string."""
+        if len(text) <= self.wrap_width and "\n" not in text:
+            return text
+        line_cap = self.max_lines * self.wrap_width
+        kept = []
+        for line in text.split("\n", self.max_lines)[:self.max_lines]:
+            line = line[:line_cap]
+            if self.output == "jsonl":
+                kept.append(line)
+            else:
+                kept.extend(textwrap.wrap(line, width=self.wrap_width) or [""])
+            if len(kept) >= self.max_lines:
+                break
+        head = "\n".join(kept[:self.max_lines])
+        if len(head) + len(kept) >= len(text):
+            return head
+        return f"{head}\n... (truncated from {text.count(chr(10)) + 1} lines, {len(text)} chars)"
+
+    def write_xml(self, tag: str, value: Any, depth: int):
+        pad = "  " * depth
+        if XML_NAME.match(tag):
+            open_tag, close_tag = tag, tag
+        else:
+            open_tag, close_tag = f"key name={quoteattr(tag)}", "key"
+        write = self.stream.write
+        if isinstance(value, dict):
+            write(f"{pad}<{open_tag}>\n")
+            for k, v in value.items():
+                self.write_xml(k, v, depth + 1)
+            write(f"{pad}</{close_tag}>\n")
+        elif isinstance(value, list):
+            write(f"{pad}<{open_tag}>\n")
+            for item in value:
+                self.write_xml("item", item, depth + 1)
+            write(f"{pad}</{close_tag}>\n")
+        else:
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            write(f"{pad}<{open_tag}>{escape(str(value))}</{close_tag}>\n")
+
+
+class OutputWriter:
+    """Renders and writes agent messages on a background thread.
+
+    Messages pass through a bounded queue so a slow terminal or pipe never
+    stalls the agent stream. When the queue is full, `policy` decides:
+    block (wait for room), drop (skip; the count is reported at exit) or
+    summarize (skip; a tally is printed once the writer catches up).
+    ResultMessages are never skipped. Orchestrator status lines are
+    written by the same thread (so never into the middle of a message), from
+    an unbounded side deque it drains before each message; adding one never
+    blocks.
+    """
+
+    def __init__(self, renderer: Renderer, maxsize: int = 1000, policy: str = "summarize"):
+        self.renderer = renderer
+        self.policy = policy
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.skipped: Counter = Counter()
+        self.total_skipped = 0
+        self.lock = threading.Lock()
+        self.statuses: deque[str] = deque()
+        self.thread = threading.Thread(target=self._run, name="output-writer", daemon=True)
+        self.thread.start()
+
+    async def put(self, message, label: str | None = None):
+        item = (message, label)
+        try:
+            self.queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        if self.policy == "block" or isinstance(message, ResultMessage):
+            await asyncio.to_thread(self.queue.put, item)
+        else:
+            with self.lock:
+                self.skipped[type(message).__name__] += 1
+
+    def status(self, text: str):
+        if not self.thread.is_alive():
+            self.renderer.status(text)
+            return
+        self.statuses.append(text)
+        try:
+            self.queue.put_nowait((None, None))  # wake the writer if it is idle
+        except queue.Full:
+            pass  # it is busy and drains statuses before the next message
+
+    def _write_statuses(self):
+        while self.statuses:
+            self.renderer.status(self.statuses.popleft())
+
+    def _report_skipped(self):
+        with self.lock:
+            skipped, self.skipped = self.skipped, Counter()
+        if not skipped:
+            return
+        self.total_skipped += sum(skipped.values())
+        if self.policy == "summarize":
+            counts = ", ".join(f"{n} {name}" for name, n in skipped.most_common())
+            self.renderer.note(f"skipped {sum(skipped.values())} messages while output was behind ({counts})")
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            self._write_statuses()
+            if item is None:
+                break
+            self._report_skipped()
+            if item[0] is not None:
+                self.renderer.render(*item)
+        self._write_statuses()
+        self._report_skipped()
+        if self.policy == "drop" and self.total_skipped:
+            self.renderer.note(f"dropped {self.total_skipped} messages while output was behind")
+
+    async def close(self):
+        """Write everything still queued, then stop the writer thread."""
+        await asyncio.to_thread(self.queue.put, None)
+        await asyncio.to_thread(self.thread.join)
+
+
+OUTPUT: OutputWriter | None = None
+
+
+def print_status(text: str):
+    """Print an orchestrator status line, through OUTPUT when it is running."""
+    if OUTPUT:
+        OUTPUT.status(text)
+    else:
+        print(text)
+
+
+class TranscriptLog:
+    """Append-only JSONL transcripts, one file per subphase.
+
+    Every agent message is written in full (compact JSON, with `t` seconds
+    since the session started), followed by one "Iteration" entry with the
+    session's metrics. Writes are buffered; gzip and zstd files are
+    appended as new members/frames, which both formats read back as one stream.
+
+    Encoding and writing happen on a background thread, so serializing
+    large tool output never runs on the agent stream. Its queue is
+    unbounded: transcripts are never skipped.
+    """
+
+    SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(self, directory: str, compress: str = "none"):
+        self.directory = Path(directory)
+        self.compress = compress
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if compress == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise SystemExit("--transcript-compress zstd needs the zstandard package (uv run --with zstandard ...)")
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self.thread.start()
+
+    def open(self, subphase: str) -> "Transcript":
+        transcript = Transcript(self)
+        self.queue.put((transcript, "open", subphase))
+        return transcript
+
+    def _open_file(self, subphase: str):
+        name = re.sub(r"[^\w.-]", "_", subphase)
+        path = self.directory / f"{name}.jsonl{self.SUFFIXES[self.compress]}"
+        if self.compress == "gzip":
+            return gzip.open(path, "at", encoding="utf-8")
+        if self.compress == "zstd":
+            import zstandard
+            writer = zstandard.ZstdCompressor().stream_writer(open(path, "ab"), closefd=True)
+            return io.TextIOWrapper(io.BufferedWriter(writer, 1 << 16), encoding="utf-8")
+        return open(path, "a", encoding="utf-8", buffering=1 << 16)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            transcript, op, value = item
+            try:
+                if op == "open":
+                    transcript.file = self._open_file(value)
+                elif transcript.file is None:
+                    continue  # the open failed and was reported
+                elif op == "message":
+                    t, message = value
+                    write_json_line(transcript.file, {"t": t, "type": type(message).__name__, **to_plain(message)})
+                elif op == "entry":
+                    write_json_line(transcript.file, value)
+                else:
+                    transcript.file.close()
+                    transcript.file = None
+            except Exception as e:
+                print(f"Transcript write failed: {e!r}", file=sys.stderr)
+
+    async def close(self):
+        """Write everything still queued, then stop the writer thread."""
+        await asyncio.to_thread(self.queue.put, None)
+        await asyncio.to_thread(self.thread.join)
+
+
+class Transcript:
+    """One session's transcript file; its writes are queued for TranscriptLog's thread."""
+
+    def __init__(self, log: TranscriptLog):
+        self.log = log
+        self.file = None  # only touched by the writer thread
+
+    def write_message(self, t: float, message):
+        self.log.queue.put((self, "message", (t, message)))
+
+    def write_entry(self, entry: dict):
+        self.log.queue.put((self, "entry", dict(entry)))
+
+    def close(self):
+        self.log.queue.put((self, "close", None))
+
+
+TRANSCRIPTS: TranscriptLog | None = None
+
+
+class Checkpoints:
+    """Per-subphase session checkpoints, persisted as one JSON file.
+
+    Each entry records the agent session id, its cwd, the coarse step it
+    reached and the files it has looked at. Entries are saved (atomically,
+    at most once a second while a session streams) so an interrupted or
+    crashed run can be continued with --resume.
+    """
+
+    STEPS = {
+        "EnterPlanMode": "exploring",
+        "ExitPlanMode": "plan written",
+        "Edit": "implementing",
+        "MultiEdit": "implementing",
+        "Write": "implementing",
+        "NotebookEdit": "implementing",
+    }
+    MAX_FILES = 200
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = Path(path)
+        self.resume = resume
+        self.entries: dict[str, dict] = {}
+        if self.path.exists():
+            self.entries = json.loads(self.path.read_text()).get("subphases", {})
+        self.last_save = 0.0
+
+    def resumable(self, subphase: str) -> dict | None:
+        """The checkpoint to resume `subphase` from, if --resume and its last session did not finish."""
+        entry = self.entries.get(subphase)
+        if self.resume and entry and entry.get("session_id") and entry.get("status") != "finished":
+            return entry
+        return None
+
+    def update(self, subphase: str, flush: bool = False, **values):
+        entry = self.entries.setdefault(subphase, {"explored_files": []})
+        entry.update(values, updated_at=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        if flush or time.monotonic() - self.last_save > 1:
+            self.save()
+
+    def record_tool(self, subphase: str, block: ToolUseBlock):
+        entry = self.entries.setdefault(subphase, {"explored_files": []})
+        files = entry["explored_files"]
+        for key in ("file_path", "notebook_path", "path"):
+            value = block.input.get(key)
+            if isinstance(value, str):
+                if value in files:
+                    files.remove(value)
+                files.append(value)
+        del files[:-self.MAX_FILES]
+        step = self.STEPS.get(block.name)
+        if block.name == "Bash" and "git commit" in str(block.input.get("command", "")):
+            step = "committing"
+        self.update(subphase, last_tool=block.name, **({"last_step": step} if step else {}))
+
+    def save(self):
+        self.last_save = time.monotonic()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"subphases": self.entries}, indent=1))
+        os.replace(tmp, self.path)
+
+
+CHECKPOINTS: Checkpoints | None = None
+
+
+async def get_checkpoint_path(plan_path: str) -> str:
+    """Checkpoint file for a plan: in the git dir when the plan is in a repo, else next to the plan."""
+    plan_abs = os.path.abspath(plan_path)
+    key = hashlib.sha1(plan_abs.encode()).hexdigest()[:8]
+    name = f"implement-plan-{Path(plan_abs).stem}-{key}.json"
+    common_dir = await git(
+        "rev-parse", "--path-format=absolute", "--git-common-dir",
+        cwd=os.path.dirname(plan_abs), check=False,
+    )
+    return os.path.join(common_dir or os.path.dirname(plan_abs), name)
+
+
+def write_json_line(f, entry: dict):
+    f.write(json.dumps(entry, separators=(",", ":"), default=str) + "\n")
+
+
+def parse_ids(value: str | None, known: set[str] | dict) -> list[str]:
+    """The phase ids named by a gate id attribute.
+
+    Ids are free-form descriptions and may contain spaces, so the whole
+    value is tried as one id first. Otherwise it is a list separated by
+    commas, or by whitespace when the words are known ids; a part that
+    matches nothing is kept whole, to be reported as unknown.
+    """
+    value = (value or "").strip()
+    if not value or value in known:
+        return [value] if value else []
+    ids = []
+    for part in (p.strip() for p in value.split(",")):
+        if not part:
+            continue
+        if part in known or not any(word in known for word in part.split()):
+            ids.append(part)
+        else:
+            ids += part.split()
+    return ids
+
+
+def build_plan_graph(root: ET.Element) -> dict:
+    """Build the subphase dependency DAG from a parsed plan.
+
+    Every <phase> nested in another <phase> is a unit of work. A phase's
+    <gates> elements name phases that must complete before it (and all
+    phases nested in it) can start; its <gating> elements name phases that
+    wait for it. A gate on a phase that contains subphases means all of
+    them, and a subphase waits for its own nested subphases.
+
+    Returns {"order": ids in document order, "status": id -> status,
+    "deps": id -> set of ids it waits for, "unknown": referenced ids that
+    are not in the plan, "blocked": subphases gated on an unknown id, which
+    can never start}.
+    """
+    units = [sp for sp in root.findall('.//phase/phase') if sp.get('id')]
+    unit_ids = {sp.get('id') for sp in units}
+    phases = {el.get('id'): el for el in root.iter('phase') if el.get('id')}
+
+    def units_under(phase) -> set[str]:
+        nested = {el.get('id') for el in phase.iter('phase')} & unit_ids
+        return nested
+
+    deps = {sp.get('id'): set() for sp in units}
+    unknown = set()
+    blocked = set()
+    for phase in phases.values():
+        own = units_under(phase)
+        for gate in phase.findall('gates/*'):
+            for gate_id in parse_ids(gate.get('id'), phases):
+                if gate_id not in phases:
+                    unknown.add(gate_id)
+                    blocked |= own
+                    continue
+                for unit in own:
+                    deps[unit] |= units_under(phases[gate_id])
+        for gating in phase.findall('gating/*'):
+            for gated_id in parse_ids(gating.get('id'), phases):
+                if gated_id not in phases:
+                    unknown.add(gated_id)
+                    continue
+                for unit in units_under(phases[gated_id]):
+                    deps[unit] |= own
+    for sp in units:
+        unit = sp.get('id')
+        deps[unit] |= units_under(sp)
+        deps[unit].discard(unit)
+
+    return {
+        "order": [sp.get('id') for sp in units],
+        "status": {sp.get('id'): sp.get('status', 'pending') for sp in units},
+        "deps": deps,
+        "unknown": unknown,
+        "blocked": blocked,
+    }
+
+
+class PlanState:
+    """Cached subphase state of a plan XML file.
+
+    refresh() re-parses the file only when its mtime or size changed, and
+    applies status changes incrementally: each subphase keeps a count of
+    unfinished gates, so `pending`, `ready` (gates satisfied) and
+    `completed` are maintained sets rather than recomputed per poll. A gate
+    on an unknown phase id never counts as finished.
+
+    Reads take a shared flock on the plan and set_subphase_status an
+    exclusive one. Agents edit the plan without locking, so a file that
+    fails to parse mid-write keeps the last good state until the next refresh.
+    """
+
+    def __init__(self, plan_path: str):
+        self.plan_path = plan_path
+        self.order: list[str] = []
+        self.status: dict[str, str] = {}
+        self.deps: dict[str, set[str]] = {}
+        self.unknown: set[str] = set()
+        self.blocked: set[str] = set()
+        self.completed: set[str] = set()
+        self.pending: set[str] = set()
+        self.ready: set[str] = set()
+        self.height: dict[str, int] = {}
+        self._dependents: dict[str, set[str]] = {}
+        self._waiting: dict[str, int] = {}
+        self._index: dict[str, int] = {}
+        self._key = None
+        self.refresh()
+
+    def refresh(self) -> set[str]:
+        """Re-read the plan if it changed on disk. Returns ids whose status changed."""
+        plan_file = Path(self.plan_path)
+        if not plan_file.exists():
+            raise FileNotFoundError(f"Plan file not found: {self.plan_path}")
+        st = plan_file.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        if key == self._key:
+            return set()
+
+        with open(plan_file, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            data = f.read()
+        try:
+            root = ET.fromstring(data)
+        except ET.ParseError:
+            if self._key is None:
+                raise
+            return set()
+        self._key = key
+
+        graph = build_plan_graph(root)
+        if graph["order"] != self.order or graph["deps"] != self.deps or graph["blocked"] != self.blocked:
+            self._rebuild(graph)
+            return set(self.order)
+        changed = {u for u in self.order if graph["status"][u] != self.status[u]}
+        for unit in changed:
+            self._set_status(unit, graph["status"][unit])
+        return changed
+
+    def _rebuild(self, graph: dict):
+        self.order = graph["order"]
+        self.deps = graph["deps"]
+        self.unknown = graph["unknown"]
+        self.blocked = graph["blocked"]
+        self.status = dict(graph["status"])
+        self.completed = {u for u, status in self.status.items() if status == 'completed'}
+        self.pending = set(self.order) - self.completed
+        self._dependents = {u: set() for u in self.order}
+        for unit, deps in self.deps.items():
+            for dep in deps:
+                self._dependents[dep].add(unit)
+        self._waiting = {u: len(self.deps[u] - self.completed) + (u in self.blocked) for u in self.order}
+        self.ready = {u for u in self.pending if self._waiting[u] == 0}
+        self._index = {u: i for i, u in enumerate(self.order)}
+
+        # Critical path: length of the longest chain of subphases waiting on each one,
+        # computed from the sinks up (units on a gate cycle keep height 1)
+        self.height = {}
+        remaining = {u: len(self._dependents[u]) for u in self.order}
+        stack = [u for u in self.order if remaining[u] == 0]
+        while stack:
+            unit = stack.pop()
+            self.height[unit] = 1 + max((self.height[d] for d in self._dependents[unit]), default=0)
+            for dep in self.deps[unit]:
+                remaining[dep] -= 1
+                if remaining[dep] == 0:
+                    stack.append(dep)
+        for unit in self.order:
+            self.height.setdefault(unit, 1)
+
+    def _set_status(self, unit: str, status: str):
+        was_completed = self.status[unit] == 'completed'
+        self.status[unit] = status
+        if was_completed == (status == 'completed'):
+            return
+        if was_completed:
+            self.completed.discard(unit)
+            self.pending.add(unit)
+            if self._waiting[unit] == 0:
+                self.ready.add(unit)
+        else:
+            self.completed.add(unit)
+            self.pending.discard(unit)
+            self.ready.discard(unit)
+        delta = 1 if was_completed else -1
+        for dependent in self._dependents[unit]:
+            self._waiting[dependent] += delta
+            if self._waiting[dependent] == 0 and dependent in self.pending:
+                self.ready.add(dependent)
+            else:
+                self.ready.discard(dependent)
+
+    def pending_in_order(self) -> list[str]:
+        return [u for u in self.order if u in self.pending]
+
+    def ready_in_order(self) -> list[str]:
+        return [u for u in self.order if u in self.ready]
+
+    def ready_by_priority(self) -> list[str]:
+        """Ready subphases, longest critical path first, then plan order."""
+        return sorted(self.ready, key=lambda u: (-self.height[u], self._index[u]))
+
+
 def get_pending_subphases(plan_path: str) -> list[str]:
     """Return list of pending subphase IDs from plan XML.
 
     A subphase is a <phase> nested inside another <phase>.
     Pending means status != "completed".
     """
-    plan_file = Path(plan_path)
-    if not plan_file.exists():
-        raise FileNotFoundError(f"Plan file not found: {plan_path}")
-
-    tree = ET.parse(plan_file)
-    root = tree.getroot()
-
-    pending = []
-    for subphase in root.findall('.//phase/phase'):
-        status = subphase.get('status', 'pending')
-        if status != 'completed':
-            pending.append(subphase.get('id'))
-
-    return pending
+    return PlanState(plan_path).pending_in_order()
 
 
 def is_plan_complete(plan_path: str) -> bool:
@@ -134,14 +730,29 @@ def is_plan_complete(plan_path: str) -> bool:
     return len(pending) == 0
 
 
-def get_prompt(plan_path: str) -> str:
-    return f"""Your goal is to implement the next **subphase** in {plan_path}. READ THE ENTIRE FILE.
-1. Look for the next **subphase** in {plan_path} that has status!="completed".
-    1.1. If you feel the subphase is trivial, you may attempt to do several subphases in one go. (NOT RECOMMENDED). At this point you should focus on single subphase. Do not ask me if you are not sure, (I have my responses set to always auto-approve)
-        Examples for trivial subphases:
-        - write a test
-        - run a command
-        - verify something works 
+def set_subphase_status(plan_path: str, subphase_id: str, status: str):
+    """Set a subphase's status attribute in place, keeping the file's formatting."""
+    tag_re = re.compile(r'<phase\b[^>]*\bid="%s"[^>]*>' % re.escape(subphase_id))
+
+    def set_status(match: re.Match) -> str:
+        tag = match.group(0)
+        if re.search(r'\bstatus="[^"]*"', tag):
+            return re.sub(r'\bstatus="[^"]*"', f'status="{status}"', tag)
+        return re.sub(r'\s*(/?>)$', f' status="{status}"\\1', tag)
+
+    # Rewrite in place (not via rename) so the flock held by readers stays on the same file
+    with open(plan_path, 'r+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        text = tag_re.sub(set_status, f.read(), count=1)
+        f.seek(0)
+        f.write(text)
+        f.truncate()
+
+
+def get_prompt(plan_path: str, subphase_id: str) -> str:
+    return f"""Your goal is to implement the **subphase** with id="{subphase_id}" in {plan_path}. READ THE ENTIRE FILE.
+1. Find the **subphase** with id="{subphase_id}" in {plan_path}. Its gates are already completed.
+    1.1. Other agents may be implementing other subphases at the same time, so only work on this subphase. Do not ask me if you are not sure, (I have my responses set to always auto-approve)
 2. Go into plan mode, and explore the repo as you normally do in plan mode, using Explore agents (in BFS mode).
  2.1. Include a list of files you are sure are relevant to the subphase (you might have missed some)
  2.2. As a backup to identify files you might have missed and are relevant, give them a list of general terms to rg and explore these files)
@@ -150,9 +761,24 @@ def get_prompt(plan_path: str) -> str:
 4. Exit plan mode.
 5. Again, deploy Explore agents (in DFS mode). This time, use the things you learned from the other agents to fine-tune your understanding of the codebase (same methodology as above), do this in order to gain exact line-numbers and file paths, so you wouldn't have to read so much. Your context length is more valuable than the Explore agents.
 6. Implement the plan using the information the Explore agents provided you.
-7. Set status="completed", and add tags explaining what you did in {plan_path} (2 lines max).
+7. Set status="completed" on subphase "{subphase_id}", and add tags explaining what you did in {plan_path} (2 lines max).
 8. Commit and push (or merge into the target branch, depending on the subphase instructions)."""
 
+WORKTREE_NOTE = """
+
+You are working in your own git worktree ({cwd}); other agents have their own. Commit your changes there, but do not push or merge: the worktree is merged into the main checkout when you finish."""
+
+RETRY_NOTE = """
+
+An earlier session on this subphase ended without completing it. Its work is already checked out here (branch {branch}); review it and build on it rather than starting over."""
+
+RESUME_PROMPT = """Your previous session on subphase "{subphase_id}" in {plan_path} was interrupted (last step: {last_step}). Continue from where you left off instead of starting over: do not repeat the exploration you already did. Then finish the remaining steps of the original instructions."""
+
+RESTART_NOTE = """
+
+A previous session on this subphase was interrupted (last step: {last_step}) and could not be resumed. It had already looked at these files, so start from them rather than exploring from scratch:
+{files}"""
+
 TEST_PROMPT = """Go into plan mode, write "create 'Hello there' in a new file", exit plan mode and do what the plan says."""
 
 
@@ -168,48 +794,609 @@ async def prompt_stream(prompt: str) -> AsyncIterator[dict[str, Any]]:
     yield {"type": "user", "message": {"role": "user", "content": prompt}}
 
 
-def handle_message(message):
-    """Handle a single message from the agent - XML output."""
-    truncate = isinstance(message, UserMessage)
-    d = {"type": type(message).__name__, **safe_asdict(message, truncate=truncate)}
-    print(dict_to_pretty_xml(d))
+async def handle_message(message, label: str | None = None):
+    """Queue a single message from the agent for the output writer."""
+    global OUTPUT
+    if OUTPUT is None:
+        OUTPUT = OutputWriter(Renderer())
+    await OUTPUT.put(message, label)
+
+
+class TokenBucket:
+    """A per-minute budget that refills continuously and may go into debt."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, scale: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60 * scale)
+        self.updated = now
+
+    def wait_time(self, now: float, scale: float) -> float:
+        """Seconds until the budget is positive again."""
+        self.refill(now, scale)
+        if self.level > 0:
+            return 0.0
+        return -self.level / (self.capacity / 60 * scale)
+
+
+def usage_tokens(usage: dict | None) -> int:
+    """Tokens that count toward a tokens/min quota."""
+    if not usage:
+        return 0
+    keys = ("input_tokens", "output_tokens", "cache_creation_input_tokens")
+    return sum(int(usage.get(k) or 0) for k in keys)
+
+
+class Governor:
+    """Admission control for agent sessions sharing API quotas.
+
+    Requests/min and tokens/min buckets are debited as sessions report
+    assistant turns and usage; a new session only starts while both have
+    budget. Rate-limit signals (RateLimitEvent, rate_limit errors, 429/529
+    results) halve the concurrency limit and the refill rate and pause
+    admissions until the reported reset. Turns much slower than the running
+    average trim the refill rate. Sessions that end cleanly restore both
+    additively, up to the configured maximums.
+    """
+
+    MIN_SCALE = 0.1
+    RATE_LIMIT_PAUSE = 30.0
+    SLOW_TURN = 3.0  # x the latency average
+
+    def __init__(self, max_concurrency: int, rpm: float | None = None, tpm: float | None = None):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.latency: float | None = None
+
+    def concurrency(self) -> int:
+        return max(1, int(self.limit))
+
+    def delay(self) -> float:
+        """Seconds until a new session may start (0 = now)."""
+        now = time.monotonic()
+        wait = max(0.0, self.paused_until - now)
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                wait = max(wait, bucket.wait_time(now, self.scale))
+        return wait
+
+    def on_turn(self, tokens: int, latency: float | None):
+        now = time.monotonic()
+        if self.requests:
+            self.requests.refill(now, self.scale)
+            self.requests.level -= 1
+        self.on_tokens(tokens)
+        if latency is not None:
+            if self.latency and latency > self.SLOW_TURN * self.latency:
+                self.scale = max(self.MIN_SCALE, self.scale * 0.8)
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def on_tokens(self, tokens: int):
+        if self.tokens and tokens:
+            self.tokens.refill(time.monotonic(), self.scale)
+            self.tokens.level -= tokens
+
+    def on_rate_limit(self, resets_at: float | None = None):
+        """resets_at: Unix time the limit resets, if the API said."""
+        self.limit = max(1.0, self.limit / 2)
+        self.scale = max(self.MIN_SCALE, self.scale / 2)
+        pause = resets_at - time.time() if resets_at else self.RATE_LIMIT_PAUSE
+        self.paused_until = max(self.paused_until, time.monotonic() + max(0.0, pause))
+        print_status(f"Rate limited: concurrency limit {self.concurrency()}, pausing new sessions for {max(0.0, pause):.0f}s")
+
+    def on_rate_limit_warning(self):
+        self.scale = max(self.MIN_SCALE, self.scale * 0.8)
+
+    def on_session_ok(self):
+        self.limit = min(float(self.max_concurrency), self.limit + 1)
+        self.scale = min(1.0, self.scale + 0.1)
+
+    def observe(self, message, meter: dict):
+        """Feed one SDK message of a session; `meter` holds that session's running totals."""
+        now = time.monotonic()
+        if isinstance(message, AssistantMessage):
+            if message.error == "rate_limit":
+                self.on_rate_limit()
+            key = message.message_id or id(message)
+            if key not in meter["turns"]:
+                meter["turns"].add(key)
+                tokens = usage_tokens(message.usage)
+                meter["tokens"] += tokens
+                self.on_turn(tokens, now - meter["asked_at"] if meter["asked_at"] else None)
+                meter["asked_at"] = None
+        elif isinstance(message, UserMessage):
+            meter["asked_at"] = now
+        elif isinstance(message, RateLimitEvent):
+            info = message.rate_limit_info
+            if info.status == "rejected":
+                self.on_rate_limit(info.resets_at)
+            elif info.status == "allowed_warning":
+                self.on_rate_limit_warning()
+        elif isinstance(message, ResultMessage):
+            # Usage not seen on individual turns
+            self.on_tokens(max(0, usage_tokens(message.usage) - meter["tokens"]))
+            if message.api_error_status in (429, 529):
+                self.on_rate_limit()
+            elif not message.is_error:
+                self.on_session_ok()
+
 
+GOVERNOR: Governor | None = None
 
-async def run_single_iteration(prompt: str):
-    """Run a single agent iteration."""
+
+# Swapped for fake_client.FakeClaudeSDKClient by --backend fake and the benchmark
+CLIENT_FACTORY: Callable[[ClaudeAgentOptions], Any] = ClaudeSDKClient
+
+
+class ResumeFailed(Exception):
+    """A session could not be resumed (it failed before producing any message)."""
+
+
+async def run_single_iteration(
+    prompt: str,
+    label: str | None = None,
+    cwd: str | None = None,
+    subphase: str | None = None,
+    resume: dict | None = None,
+) -> dict:
+    """Run a single agent iteration.
+
+    Args:
+        prompt: The prompt to send to the agent
+        label: Prefix printed before each message, to tell concurrent sessions apart
+        cwd: Working directory for the agent (default: current directory)
+        subphase: Subphase id, used to name the transcript file and checkpoint
+        resume: Checkpoint of an interrupted session to continue. If that
+            session can't be resumed, a fresh one starts with `prompt` plus
+            the files the old session had explored.
+
+    Returns:
+        Metrics for the session: wall time, time to first message, tool
+        calls, and the turns/usage/cost reported by the ResultMessage.
+    """
+    if resume:
+        try:
+            return await run_session(
+                RESUME_PROMPT.format(subphase_id=subphase, plan_path=resume.get("plan_path"), last_step=resume.get("last_step", "unknown")),
+                label, cwd, subphase, resume_id=resume["session_id"],
+            )
+        except ResumeFailed as e:
+            print_status(f"[{subphase}] Could not resume session {resume['session_id']} ({e}); starting a new one")
+        if resume.get("explored_files"):
+            prompt += RESTART_NOTE.format(
+                last_step=resume.get("last_step", "unknown"),
+                files="\n".join(f"- {f}" for f in resume["explored_files"]),
+            )
+    return await run_session(prompt, label, cwd, subphase)
+
+
+async def run_session(
+    prompt: str,
+    label: str | None,
+    cwd: str | None,
+    subphase: str | None,
+    resume_id: str | None = None,
+) -> dict:
+    """One ClaudeSDKClient session, with transcript, checkpoint and metrics bookkeeping."""
     options = ClaudeAgentOptions(
         can_use_tool=auto_approve,
         system_prompt={"type": "preset", "preset": "claude_code"},
         add_dirs=[os.path.expanduser("~/treebench")],
+        cwd=cwd,
+        resume=resume_id,
     )
+    checkpoints = CHECKPOINTS if subphase else None
+    if checkpoints:
+        entry = {"status": "starting", "cwd": cwd or os.getcwd(), "resumed_from": resume_id}
+        if not resume_id:
+            entry.update(session_id=None, last_step="started", explored_files=[])
+        checkpoints.update(subphase, flush=True, **entry)
+
+    metrics = {
+        "type": "Iteration",
+        "subphase": subphase,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "resumed_from": resume_id,
+        "messages": 0,
+        "tool_calls": 0,
+    }
+    transcript = TRANSCRIPTS.open(subphase or "session") if TRANSCRIPTS else None
+    start = time.perf_counter()
+    try:
+        async with CLIENT_FACTORY(options) as client:
+            await client.query(prompt_stream(prompt))
+            sent = time.perf_counter()
+            meter = {"turns": set(), "tokens": 0, "asked_at": time.monotonic()}
+            async for message in client.receive_response():
+                if GOVERNOR:
+                    GOVERNOR.observe(message, meter)
+                now = time.perf_counter()
+                if metrics["messages"] == 0:
+                    metrics["first_message_s"] = round(now - sent, 3)
+                metrics["messages"] += 1
+                if isinstance(message, SystemMessage) and checkpoints and message.data.get("session_id"):
+                    checkpoints.update(subphase, flush=True, status="running", session_id=message.data["session_id"])
+                if isinstance(message, AssistantMessage):
+                    tool_uses = [b for b in message.content if isinstance(b, ToolUseBlock)]
+                    metrics["tool_calls"] += len(tool_uses)
+                    if checkpoints:
+                        for block in tool_uses:
+                            checkpoints.record_tool(subphase, block)
+                elif isinstance(message, ResultMessage):
+                    metrics.update(
+                        subtype=message.subtype,
+                        is_error=message.is_error,
+                        num_turns=message.num_turns,
+                        duration_ms=message.duration_ms,
+                        duration_api_ms=message.duration_api_ms,
+                        total_cost_usd=message.total_cost_usd,
+                        usage=message.usage,
+                        session_id=message.session_id,
+                    )
+                if transcript:
+                    transcript.write_message(round(now - start, 3), message)
+                await handle_message(message, label)
+    except BaseException as e:
+        metrics["error"] = repr(e)
+        if resume_id and metrics["messages"] == 0 and isinstance(e, Exception):
+            raise ResumeFailed(str(e)) from e
+        raise
+    finally:
+        metrics["wall_s"] = round(time.perf_counter() - start, 3)
+        if transcript:
+            transcript.write_entry(metrics)
+            transcript.close()
+        if checkpoints:
+            status = "interrupted" if "error" in metrics else "finished"
+            if metrics.get("session_id"):
+                checkpoints.update(subphase, session_id=metrics["session_id"])
+            checkpoints.update(subphase, flush=True, status=status)
+    return metrics
+
+
+async def git(*args: str, cwd: str, check: bool = True) -> str:
+    """Run a git command without blocking the other agent sessions."""
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    if check and proc.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed in {cwd}: {err.decode().strip()}")
+    return out.decode().strip()
+
+
+class WorktreePool:
+    """Pre-created git worktrees handed out to concurrent agent sessions.
+
+    Worktrees live under the repo's git dir and are created once, up front;
+    between sessions they are reset to the main checkout's HEAD rather than
+    checked out again. Each subphase's work is committed on an
+    implement-plan/<id> branch; finished subphases are merged into the main
+    checkout, unfinished ones are where the next attempt starts from.
+    """
+
+    def __init__(self, repo_root: str, size: int):
+        self.repo_root = repo_root
+        self.size = size
+        self.paths: list[str] = []
+        self.free: list[str] = []
+        self.available = asyncio.Semaphore(0)
+
+    async def start(self):
+        """Create the worktrees (reusing any left over from a previous run)."""
+        common_dir = await git("rev-parse", "--path-format=absolute", "--git-common-dir", cwd=self.repo_root)
+        base = os.path.join(common_dir, "implement-plan-worktrees")
+        await git("worktree", "prune", cwd=self.repo_root)
+        listing = await git("worktree", "list", "--porcelain", cwd=self.repo_root)
+        registered = {line.split(" ", 1)[1] for line in listing.splitlines() if line.startswith("worktree ")}
+        head = await git("rev-parse", "HEAD", cwd=self.repo_root)
+
+        self.paths = [os.path.join(base, f"wt-{i}") for i in range(self.size)]
+        for path in self.paths:
+            if path not in registered:
+                # Sequential: concurrent `worktree add` races on the repo's lock files
+                await git("worktree", "add", "-q", "--detach", "-f", path, head, cwd=self.repo_root)
+            self.release(path)
+
+    async def acquire(self, prefer: str | None = None, start: str | None = None) -> str:
+        """Take a free worktree, reset to `start` (default: the main checkout's current HEAD).
+
+        If `prefer` (the worktree of an interrupted session being resumed)
+        is free, it is handed out as is, keeping the session's uncommitted work.
+        """
+        await self.available.acquire()
+        if prefer in self.free:
+            self.free.remove(prefer)
+            return prefer
+        path = self.free.pop(0)
+        head = start or await git("rev-parse", "HEAD", cwd=self.repo_root)
+        await git("checkout", "-q", "-f", "--detach", head, cwd=path)
+        await git("clean", "-qfd", cwd=path)
+        return path
+
+    def release(self, path: str):
+        self.free.append(path)
+        self.available.release()
+
+    async def unfinished_branch(self, subphase: str) -> str | None:
+        """The subphase's branch if an earlier attempt left work on it that is not merged yet."""
+        branch = f"implement-plan/{subphase}"
+        if not await git("rev-parse", "--verify", "-q", f"refs/heads/{branch}", cwd=self.repo_root, check=False):
+            return None
+        try:
+            await git("merge-base", "--is-ancestor", branch, "HEAD", cwd=self.repo_root)
+            return None
+        except RuntimeError:
+            return branch
+
+    async def save(self, path: str, subphase: str) -> str:
+        """Commit anything the agent left uncommitted; return the branch holding the work.
+
+        The worktree started from the branch if it held unfinished work, so
+        moving the branch to HEAD never drops an earlier attempt's commits.
+        """
+        if await git("status", "--porcelain", cwd=path):
+            await git("add", "-A", cwd=path)
+            await git("commit", "-q", "-m", f"Implement subphase {subphase}", cwd=path)
+        branch = f"implement-plan/{subphase}"
+        await git("branch", "-f", branch, "HEAD", cwd=path)
+        return branch
 
-    async with ClaudeSDKClient(options) as client:
-        await client.query(prompt_stream(prompt))
-        async for message in client.receive_response():
-            handle_message(message)
+    async def merge(self, branch: str, subphase: str, plan_rel: str | None) -> bool:
+        """Merge a subphase branch into the main checkout.
 
+        Conflicts confined to the plan file (concurrent status updates) are
+        resolved by keeping the main copy and marking the subphase completed.
+        Returns False, leaving the main checkout untouched, on any other
+        conflict or if git refuses the merge (e.g. local changes in the way).
+        """
+        try:
+            await git("merge", "-q", "--no-ff", "-m", f"Merge subphase {subphase}", branch, cwd=self.repo_root)
+            return True
+        except RuntimeError as e:
+            error = str(e)
+        conflicts = (await git("diff", "--name-only", "--diff-filter=U", cwd=self.repo_root)).split()
+        if not conflicts:
+            print_status(f"[{subphase}] {error}")
+            await git("merge", "--abort", cwd=self.repo_root, check=False)
+            return False
+        if plan_rel is not None and conflicts == [plan_rel]:
+            await git("checkout", "-q", "--ours", "--", plan_rel, cwd=self.repo_root)
+            set_subphase_status(os.path.join(self.repo_root, plan_rel), subphase, "completed")
+            await git("add", "--", plan_rel, cwd=self.repo_root)
+            await git("commit", "-q", "--no-edit", cwd=self.repo_root)
+            return True
+        await git("merge", "--abort", cwd=self.repo_root)
+        return False
 
-async def run_agent(prompt: str, plan_path: str, max_iterations: int | None = None):
-    """Run agent with prompt.
+    async def close(self, keep_unfinished: bool = False):
+        """Remove the worktrees.
+
+        keep_unfinished (after an interrupted or failed run) keeps those an
+        unfinished session ran in, with their uncommitted work, for --resume.
+        """
+        keep = set()
+        if keep_unfinished and CHECKPOINTS:
+            keep = {e.get("cwd") for e in CHECKPOINTS.entries.values() if e.get("status") != "finished"}
+        for path in self.paths:
+            if path in keep:
+                print_status(f"Keeping worktree {path}: its session did not finish (continue it with --resume)")
+                continue
+            await git("worktree", "remove", "--force", path, cwd=self.repo_root, check=False)
+
+
+async def run_in_worktree(
+    pool: WorktreePool,
+    subphase: str,
+    prompt_for: Callable[[str, str], str],
+    plan_path: str,
+    plan_rel: str | None,
+    label: str | None,
+) -> tuple[str, str, bool]:
+    """Run one subphase in a pooled worktree.
+
+    Returns (worktree path, branch with the work, whether the agent completed it).
+    The caller merges the branch and releases the worktree.
+    """
+    resume = CHECKPOINTS.resumable(subphase) if CHECKPOINTS else None
+    # A retry continues from the work an earlier attempt left on the subphase's branch
+    unfinished = await pool.unfinished_branch(subphase)
+    prefer = resume and resume.get("cwd")
+    path = await pool.acquire(prefer=prefer, start=unfinished)
+    try:
+        agent_plan = os.path.join(path, plan_rel) if plan_rel else plan_path
+        prompt = prompt_for(subphase, agent_plan) + WORKTREE_NOTE.format(cwd=path)
+        if unfinished and path != prefer:
+            prompt += RETRY_NOTE.format(branch=unfinished)
+        if resume:
+            resume = {**resume, "plan_path": agent_plan}
+        await run_single_iteration(prompt, label, cwd=path, subphase=subphase, resume=resume)
+        completed = PlanState(agent_plan).status.get(subphase) == 'completed'
+        return path, await pool.save(path, subphase), completed
+    except Exception:
+        # Keep a failed session's work on its branch for the retry to start from
+        try:
+            await pool.save(path, subphase)
+        except Exception:
+            pass
+        pool.release(path)
+        raise
+    except BaseException:
+        pool.release(path)
+        raise
+
+
+async def run_agent(
+    prompt_for: Callable[[str, str], str],
+    plan_path: str,
+    max_iterations: int | None = None,
+    concurrency: int = 1,
+    pool: WorktreePool | None = None,
+    watch_interval: float = 0.25,
+    stall_limit: int = 3,
+    backoff: float = 5,
+    max_backoff: float = 300,
+):
+    """Run agents over the plan's subphase DAG.
+
+    Each ready subphase (all gates completed) gets its own agent session;
+    up to `concurrency` sessions run at once, further limited by GOVERNOR
+    when set. Ready subphases on the longest remaining chain of gates
+    start first. The loop wakes as soon as a
+    session ends or the plan file changes (polled every `watch_interval`),
+    so a subphase starts the moment its gates are marked completed.
+
+    A session makes progress if the set of completed subphases changed
+    while it ran. A subphase whose session made no progress (or raised) is retried
+    after an exponential backoff, and given up on after `stall_limit`
+    sessions in a row without progress.
+
+    With a worktree pool, each session runs in its own worktree and finished
+    subphases are merged back in plan order, so a subphase only starts from
+    a HEAD that already contains the work it is gated on.
 
     Args:
-        prompt: The prompt to send to the agent
-        plan_path: Path to plan XML for termination check
-        max_iterations: Max iterations to run (None = infinite)
+        prompt_for: Builds the prompt for a subphase id and the plan path the agent should edit
+        plan_path: Path to plan XML for scheduling and termination check
+        max_iterations: Max agent sessions to start (None = infinite)
+        concurrency: Max sessions running at the same time
+        pool: Worktrees to isolate concurrent sessions in (None = run in the current directory)
+        watch_interval: Seconds between checks of the plan file for changes
+        stall_limit: Sessions in a row without progress before giving up on a subphase
+        backoff: Seconds before retrying a subphase after its first session without progress
+        max_backoff: Upper bound on the retry delay
     """
     iteration = 0
-    while max_iterations is None or iteration < max_iterations:
-        # Check termination condition
-        pending = get_pending_subphases(plan_path)
-        if not pending:
-            print("All subphases completed! Plan is done.")
-            break
+    state = PlanState(plan_path)
+    running: dict[str, asyncio.Task] = {}
+    completed_at_start: dict[str, frozenset[str]] = {}
+    stalls: dict[str, int] = {}
+    retry_at: dict[str, float] = {}
+    failed: set[str] = set()
+    warned = False
+    plan_rel = None
+    if pool is not None:
+        plan_abs = os.path.abspath(plan_path)
+        if plan_abs.startswith(pool.repo_root + os.sep):
+            plan_rel = os.path.relpath(plan_abs, pool.repo_root)
+    try:
+        while True:
+            state.refresh()
+            if state.unknown and not warned:
+                print_status(
+                    f"Warning: gates reference unknown phase ids: {sorted(state.unknown)}; "
+                    f"{sorted(state.blocked & state.pending)} will not start"
+                )
+                warned = True
+
+            # Check termination condition
+            pending = state.pending
+            if not pending and not running:
+                print_status("All subphases completed! Plan is done.")
+                break
 
-        iteration += 1
-        print(f"[Iteration {iteration}] {len(pending)} subphases remaining: {pending[0]}, ...")
+            now = time.monotonic()
+            can_start = max_iterations is None or iteration < max_iterations
+            ready = [
+                u for u in state.ready_by_priority()
+                if u not in running and u not in failed and retry_at.get(u, 0) <= now
+            ] if can_start else []
+            limit = min(concurrency, GOVERNOR.concurrency()) if GOVERNOR else concurrency
+            throttle = 0.0
+            while ready and len(running) < limit and (max_iterations is None or iteration < max_iterations):
+                throttle = GOVERNOR.delay() if GOVERNOR else 0.0
+                if throttle:
+                    break
+                subphase = ready.pop(0)
+                iteration += 1
+                print_status(f"[Iteration {iteration}] {len(pending)} subphases remaining, starting {subphase} ({len(running) + 1} running)")
+                label = subphase if concurrency > 1 else None
+                if pool is None:
+                    resume = CHECKPOINTS.resumable(subphase) if CHECKPOINTS else None
+                    if resume:
+                        resume = {**resume, "plan_path": plan_path}
+                    coro = run_single_iteration(prompt_for(subphase, plan_path), label, subphase=subphase, resume=resume)
+                else:
+                    coro = run_in_worktree(pool, subphase, prompt_for, plan_path, plan_rel, label)
+                running[subphase] = asyncio.create_task(coro)
+                completed_at_start[subphase] = frozenset(state.completed)
 
-        await run_single_iteration(prompt)
-        await asyncio.sleep(1)
+            can_start = max_iterations is None or iteration < max_iterations
+            waiting = [u for u in state.pending if u in retry_at and u not in failed] if can_start else []
+            throttled = bool(ready) and throttle > 0
+            if not running and not waiting and not throttled:
+                if pending and can_start:
+                    print_status(f"No runnable subphases: {state.pending_in_order()} are failed or waiting on gates that cannot complete.")
+                break
+
+            timeout = watch_interval
+            if waiting:
+                timeout = min(timeout, max(0, min(retry_at[u] for u in waiting) - now))
+            if throttled and not running:
+                timeout = min(max(timeout, throttle), 60)
+            if not running:
+                await asyncio.sleep(timeout)
+                continue
+            done, _ = await asyncio.wait(running.values(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                continue
+            # Iterate in plan order so simultaneous finishes merge in dependency order
+            for subphase in [u for u in state.order if u in running and running[u] in done]:
+                try:
+                    result = running.pop(subphase).result()
+                except Exception as e:
+                    # Counted as a session without progress below: retried with backoff, then given up on
+                    print_status(f"[{subphase}] Session failed: {e!r}")
+                    continue
+                if pool is None:
+                    continue
+                path, branch, completed = result
+                try:
+                    if not completed:
+                        print_status(f"[{subphase}] Session ended without completing it; work kept on {branch}")
+                    elif await pool.merge(branch, subphase, plan_rel):
+                        print_status(f"[{subphase}] Merged {branch}")
+                    else:
+                        print_status(f"[{subphase}] Merge failed; work kept on {branch}, not retrying")
+                        failed.add(subphase)
+                        if plan_rel is None:
+                            set_subphase_status(plan_path, subphase, "merge-conflict")
+                finally:
+                    pool.release(path)
+
+            # Progress check, after merges have landed in the plan
+            state.refresh()
+            for subphase in [u for u in completed_at_start if u not in running]:
+                if state.completed != completed_at_start.pop(subphase):
+                    stalls.pop(subphase, None)
+                    retry_at.pop(subphase, None)
+                    continue
+                if subphase in failed:
+                    continue
+                stalls[subphase] = stalls.get(subphase, 0) + 1
+                if stalls[subphase] >= stall_limit:
+                    print_status(f"[{subphase}] No progress in {stalls[subphase]} sessions in a row; giving up on it")
+                    failed.add(subphase)
+                    retry_at.pop(subphase, None)
+                else:
+                    delay = min(backoff * 2 ** (stalls[subphase] - 1), max_backoff)
+                    print_status(f"[{subphase}] Session made no progress ({stalls[subphase]}/{stall_limit}); retrying in {delay:.1f}s")
+                    retry_at[subphase] = time.monotonic() + delay
+    finally:
+        for task in running.values():
+            task.cancel()
+        # Let cancelled sessions finish their cleanup before worktrees are closed
+        await asyncio.gather(*running.values(), return_exceptions=True)
 
 
 async def main():
@@ -225,6 +1412,93 @@ async def main():
         default=None,
         help="Max iterations to run (default: infinite)",
     )
+    parser.add_argument(
+        "--concurrency", "-j",
+        type=int,
+        default=1,
+        help="Max subphases to run at the same time when their gates allow it (default: 1)",
+    )
+    parser.add_argument(
+        "--worktrees",
+        action="store_true",
+        help="Run each session in its own pre-created git worktree (one per --concurrency) and merge finished subphases back",
+    )
+    parser.add_argument(
+        "--output",
+        choices=["pretty", "xml", "jsonl"],
+        default="pretty",
+        help="Message format: highlighted XML, streamed plain XML, or one JSON object per line (default: pretty)",
+    )
+    parser.add_argument(
+        "--output-buffer",
+        type=int,
+        default=1000,
+        help="Messages queued for the output writer before --output-policy applies (default: 1000)",
+    )
+    parser.add_argument(
+        "--output-policy",
+        choices=["block", "drop", "summarize"],
+        default="summarize",
+        help="When the output queue is full: wait for it, skip messages, or skip and print a tally (default: summarize)",
+    )
+    parser.add_argument(
+        "--transcript-dir",
+        default=None,
+        help="Append a JSONL transcript with per-session metrics to <dir>/<subphase>.jsonl (default: off)",
+    )
+    parser.add_argument(
+        "--transcript-compress",
+        choices=["none", "gzip", "zstd"],
+        default="none",
+        help="Compress transcripts (zstd needs the zstandard package) (default: none)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the agent sessions of subphases whose last run was interrupted, instead of starting fresh",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["sdk", "fake"],
+        default="sdk",
+        help="Agent backend; fake runs synthesized sessions offline and marks each subphase completed (default: sdk)",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        metavar="TRANSCRIPT",
+        help="With --backend fake, replay the sessions of a --transcript-dir transcript instead of synthesizing them",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=0.25,
+        help="Seconds between checks of the plan file for newly completed gates (default: 0.25)",
+    )
+    parser.add_argument(
+        "--stall-limit",
+        type=int,
+        default=3,
+        help="Give up on a subphase after this many sessions in a row that complete nothing (default: 3)",
+    )
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        default=5,
+        help="Seconds before retrying a subphase after a session without progress, doubling each time (default: 5)",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="API requests/min budget shared by all sessions; new sessions wait while it is spent (default: unlimited)",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=None,
+        help="Tokens/min budget shared by all sessions (default: unlimited)",
+    )
     parser.add_argument(
         "plan_path",
         type=str,
@@ -236,25 +1510,73 @@ async def main():
         help="Show plan status (pending subphases) and exit",
     )
     args = parser.parse_args()
+    # Agents commit as they go; several in one checkout would race on its index.
+    # Fake sessions never touch git, so they may share it.
+    if args.concurrency > 1 and not args.worktrees and args.backend == "sdk" and not args.status:
+        parser.error("--concurrency > 1 needs --worktrees: each agent commits its work, and concurrent commits in one checkout conflict")
 
     if args.status:
-        pending = get_pending_subphases(args.plan_path)
-        total = len(ET.parse(args.plan_path).findall('.//phase/phase'))
-        completed = total - len(pending)
+        state = PlanState(args.plan_path)
+        pending = state.pending_in_order()
         print(f"Plan: {args.plan_path}")
-        print(f"Progress: {completed}/{total} subphases completed")
+        print(f"Progress: {len(state.completed)}/{len(state.order)} subphases completed")
         if pending:
             print(f"\nPending ({len(pending)}):")
             for p in pending:
                 print(f"  - {p}")
+            ready = state.ready_in_order()
+            print(f"\nReady to start ({len(ready)}):")
+            for p in ready:
+                print(f"  - {p}")
         else:
             print("\nAll subphases completed!")
         return
 
-    if args.test:
-        await run_agent(TEST_PROMPT, args.plan_path, max_iterations=1)
-    else:
-        await run_agent(get_prompt(args.plan_path), args.plan_path, max_iterations=args.max_iterations)
+    global OUTPUT, TRANSCRIPTS, CHECKPOINTS, CLIENT_FACTORY, GOVERNOR
+    GOVERNOR = Governor(args.concurrency, rpm=args.rpm, tpm=args.tpm)
+    if args.backend == "fake":
+        from fake_client import FakeConfig, fake_client_factory
+        CLIENT_FACTORY = fake_client_factory(FakeConfig(
+            replay=args.replay,
+            on_complete=lambda subphase, plan: set_subphase_status(plan, subphase, "completed"),
+        ))
+    OUTPUT = OutputWriter(Renderer(args.output), args.output_buffer, args.output_policy)
+    if args.transcript_dir:
+        TRANSCRIPTS = TranscriptLog(args.transcript_dir, args.transcript_compress)
+    if not args.test:
+        CHECKPOINTS = Checkpoints(await get_checkpoint_path(args.plan_path), resume=args.resume)
+
+    pool = None
+    if args.worktrees:
+        repo_root = await git("rev-parse", "--show-toplevel", cwd=os.getcwd())
+        plan_abs = os.path.abspath(args.plan_path)
+        if plan_abs.startswith(repo_root + os.sep) and await git("status", "--porcelain", "--", plan_abs, cwd=repo_root):
+            raise SystemExit(f"Commit {args.plan_path} first: worktrees start from HEAD and merge plan updates back into it.")
+        pool = WorktreePool(repo_root, args.concurrency)
+        await pool.start()
+
+    clean_exit = False
+    try:
+        if args.test:
+            await run_agent(lambda subphase, plan: TEST_PROMPT, args.plan_path, max_iterations=1, pool=pool)
+        else:
+            await run_agent(
+                lambda subphase, plan: get_prompt(plan, subphase),
+                args.plan_path,
+                max_iterations=args.max_iterations,
+                concurrency=args.concurrency,
+                pool=pool,
+                watch_interval=args.watch_interval,
+                stall_limit=args.stall_limit,
+                backoff=args.backoff,
+            )
+        clean_exit = True
+    finally:
+        if pool is not None:
+            await pool.close(keep_unfinished=not clean_exit)
+        await OUTPUT.close()
+        if TRANSCRIPTS:
+            await TRANSCRIPTS.close()
 
 
 if __name__ == "__main__":
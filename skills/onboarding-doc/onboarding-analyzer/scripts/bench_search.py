@@ -0,0 +1,245 @@
+# /// script
+# dependencies = [
+#   "bm25s",
+#   "PyStemmer",
+# ]
+# ///
+
+"""
+Benchmark search.py on synthetic git repositories.
+
+Generates repos of the requested sizes (mixed text and binary files), then
+times a cold index build, a warm (cached) query and an incremental update
+after editing a few files, recording the peak RSS of each search.py run.
+Runs fully offline.
+
+Usage:
+    uv run bench_search.py --sizes 1000,10000 --output results.json
+    uv run bench_search.py --sizes 5000 -- --chunks --tokenizer code
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SEARCH_SCRIPT = Path(__file__).with_name("search.py")
+
+WORDS_PER_FILE = (50, 800)
+DIRS_PER_LEVEL = 12
+FILES_PER_DIR = 40
+EXTENSIONS = [".py", ".md", ".txt", ".js", ".json"]
+
+
+def make_vocab(rng: random.Random, size: int) -> list[str]:
+    """Build a pseudo-English and identifier vocabulary."""
+    syllables = ["ka", "lo", "mi", "ren", "to", "sa", "vel", "dor", "ix", "un", "pra", "gem"]
+    words = set()
+    while len(words) < size:
+        word = "".join(rng.choice(syllables) for _ in range(rng.randint(1, 4)))
+        if rng.random() < 0.2:
+            word = word + "_" + rng.choice(syllables) + rng.choice(syllables)
+        elif rng.random() < 0.2:
+            word = word + rng.choice(syllables).capitalize() + rng.choice(syllables)
+        words.add(word)
+    return sorted(words)
+
+
+def file_path_for(i: int) -> str:
+    """Spread files over a few levels of directories."""
+    d1, rest = divmod(i // FILES_PER_DIR, DIRS_PER_LEVEL)
+    return f"d{d1 % DIRS_PER_LEVEL}/d{rest}/f{i}"
+
+
+def generate_repo(root: Path, n_files: int, binary_ratio: float, seed: int) -> list[str]:
+    """Create and commit a synthetic repo. Returns the text file paths."""
+    rng = random.Random(seed)
+    vocab = make_vocab(rng, 5000)
+    # Zipf-like word frequencies, as in natural text and code
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+
+    root.mkdir(parents=True)
+    text_files = []
+    for i in range(n_files):
+        path = root / file_path_for(i)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if rng.random() < binary_ratio:
+            path = path.with_suffix(".bin")
+            path.write_bytes(rng.randbytes(rng.randint(256, 16384)))
+            continue
+        path = path.with_suffix(rng.choice(EXTENSIONS))
+        words = rng.choices(vocab, weights, k=rng.randint(*WORDS_PER_FILE))
+        lines = [" ".join(words[j:j + 10]) for j in range(0, len(words), 10)]
+        path.write_text("\n".join(lines) + "\n")
+        text_files.append(str(path.relative_to(root)))
+
+    git = ["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost"]
+    subprocess.run(["git", "init", "-q"], cwd=root, check=True)
+    subprocess.run(git + ["add", "-A"], cwd=root, check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "synthetic corpus"], cwd=root, check=True)
+    return text_files
+
+
+def run_search(repo: Path, search_args: list[str]) -> dict:
+    """Run search.py once in `repo`. Returns wall time and peak RSS."""
+    cmd = [sys.executable, str(SEARCH_SCRIPT), "--no-daemon", *search_args]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - start
+    stderr = proc.stderr.read().decode()
+    proc.stderr.close()
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"search.py failed in {repo}:\n{stderr}")
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {"seconds": seconds, "peak_rss_mb": rusage.ru_maxrss * scale / 2**20}
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Median time and max RSS over repeated runs."""
+    return {
+        "seconds": statistics.median(r["seconds"] for r in runs),
+        "seconds_min": min(r["seconds"] for r in runs),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "runs": len(runs),
+    }
+
+
+def bench_size(repo: Path, text_files: list[str], args, search_args: list[str]) -> list[dict]:
+    """Time cold, warm and incremental searches on one repo."""
+    cache_dir = repo / ".git" / "bm25s-cache"
+    query = ["-t", "kalo", "-t", "miren"]
+    rng = random.Random(args.seed)
+    results = []
+
+    cold = []
+    for _ in range(args.repeat):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        cold.append(run_search(repo, query + search_args))
+    results.append({"stage": "cold_index", **summarize(cold)})
+
+    warm = [run_search(repo, query + search_args) for _ in range(args.repeat)]
+    results.append({"stage": "warm_query", **summarize(warm)})
+
+    incremental = []
+    for _ in range(args.repeat):
+        for rel in rng.sample(text_files, min(args.modify, len(text_files))):
+            with open(repo / rel, "a") as f:
+                f.write(f"edited {rng.random()}\n")
+        incremental.append(run_search(repo, query + search_args))
+    results.append({"stage": "incremental_update", "modified_files": args.modify, **summarize(incremental)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search.py on synthetic git repos")
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000",
+        help="Comma-separated repo sizes in files (default: 1000,10000)"
+    )
+    parser.add_argument(
+        "--binary-ratio",
+        type=float,
+        default=0.05,
+        help="Fraction of generated files that are binary (default: 0.05)"
+    )
+    parser.add_argument(
+        "--modify",
+        type=int,
+        default=10,
+        help="Files edited before each incremental-update run (default: 10)"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per stage; the median time is reported (default: 3)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="Where to generate repos (default: a temp dir, removed afterwards; the repos created in a given dir are removed, never the dir)"
+    )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="Keep generated repos; they are reused by later runs with the same --workdir"
+    )
+    parser.add_argument(
+        "--output", "-o",
+        default=None,
+        help="Write results JSON here (default: stdout)"
+    )
+    parser.add_argument(
+        "search_args",
+        nargs=argparse.REMAINDER,
+        help="Extra search.py arguments after --, e.g. -- --chunks --tokenizer code"
+    )
+    args = parser.parse_args()
+    search_args = [a for a in args.search_args if a != "--"]
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="bench-search-"))
+    created = []
+    results = []
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            repo = workdir / f"repo-{size}-{args.seed}"
+            if repo.exists() and args.keep:
+                text_files = [
+                    f for f in subprocess.run(
+                        ["git", "ls-files"], cwd=repo, capture_output=True, text=True, check=True
+                    ).stdout.split("\n") if f and not f.endswith(".bin")
+                ]
+                subprocess.run(["git", "checkout", "-q", "."], cwd=repo, check=True)
+            else:
+                shutil.rmtree(repo, ignore_errors=True)
+                created.append(repo)
+                start = time.perf_counter()
+                text_files = generate_repo(repo, size, args.binary_ratio, args.seed)
+                print(f"Generated {size} files in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+            for row in bench_size(repo, text_files, args, search_args):
+                row = {"files": size, **row}
+                results.append(row)
+                print(
+                    f"{size:>8} files  {row['stage']:<20} {row['seconds']:8.3f}s  "
+                    f"{row['peak_rss_mb']:8.1f} MiB",
+                    file=sys.stderr
+                )
+    finally:
+        if not args.keep:
+            # Only remove what this run made, never a user-supplied --workdir itself
+            if args.workdir:
+                for repo in created:
+                    shutil.rmtree(repo, ignore_errors=True)
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "search_args": search_args,
+        "binary_ratio": args.binary_ratio,
+        "seed": args.seed,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
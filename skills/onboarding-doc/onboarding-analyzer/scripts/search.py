@@ -6,12 +6,830 @@
 # ///
 
 import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
 import subprocess
 import sys
+import tempfile
+import time
 from pathlib import Path
 
-import bm25s
-import Stemmer
+# Opt-in per-stage timings and counters, see --profile
+PROFILE = {"enabled": False, "stages": {}, "counts": {}}
+
+# Imported by import_backend() so the daemon client starts without them
+bm25s = None
+np = None
+Stemmer = None
+
+CACHE_DIR_NAME = "bm25s-cache"
+CACHE_KEEP = 8  # Cached snapshots (and postings stores) kept per repository
+STORE_DIR_PREFIX = "postings-"
+META_NAMES = ("config", "paths", "shas", "skipped", "vocab")
+ARRAY_NAMES = ("df", "doc_len", "doc_lines", "post_tok", "post_tf", "post_off")
+SNIFF_BYTES = 8000  # Same window git uses to detect binary files
+READ_BATCH_SIZE = 256
+DAEMON_TIMEOUT = 10.0  # Seconds a client waits for a daemon reply
+
+# Lines where a chunk may start in --chunks mode: top-level definitions in
+# code and headings in markdown. Other files are cut into fixed windows.
+PYTHON_BOUNDARY = re.compile(r"(?:async\s+def|def|class)\s|@")
+MARKDOWN_BOUNDARY = re.compile(r"#{1,6}\s")
+BOUNDARIES = {
+    ".py": PYTHON_BOUNDARY,
+    ".pyi": PYTHON_BOUNDARY,
+    ".md": MARKDOWN_BOUNDARY,
+    ".markdown": MARKDOWN_BOUNDARY,
+}
+
+# Code tokenizer: identifiers, their camelCase/snake_case parts, and names
+# introduced by definition keywords (repeated to boost definition sites)
+IDENTIFIER = re.compile(r"[^\W\d]\w+")
+SUBWORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+DEFINITION = re.compile(
+    r"\b(?:def|class|function|func|fn|interface|struct|enum|trait|type)\s+([^\W\d]\w*)"
+)
+DEFINITION_BOOST = 2  # Extra copies of each defined name's tokens
+
+
+def import_backend():
+    """Import bm25s, numpy and PyStemmer into module globals."""
+    global bm25s, np, Stemmer
+    import bm25s
+    import numpy as np
+    import Stemmer
+
+
+@contextlib.contextmanager
+def profile_stage(name: str):
+    """Add the time spent in the block to stage `name` when profiling."""
+    if not PROFILE["enabled"]:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = PROFILE["stages"]
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def profile_count(name: str, n: int = 1):
+    """Add `n` to counter `name` when profiling."""
+    if PROFILE["enabled"]:
+        PROFILE["counts"][name] = PROFILE["counts"].get(name, 0) + n
+
+
+def emit_profile():
+    """Write stage timings, counters and peak RSS as one JSON line on stderr."""
+    import resource
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    stages = {k: round(v, 4) for k, v in PROFILE["stages"].items()}
+    report = {"stages": stages, "counts": PROFILE["counts"], "peak_rss_mb": round(peak / 2**20, 1)}
+    print(json.dumps({"profile": report}), file=sys.stderr)
+
+
+def git(*args: str) -> str:
+    """Run a git command and return its stdout."""
+    result = subprocess.run(
+        ["git", *args],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return result.stdout
+
+
+def get_cache_dir(cache_dir: str | None) -> Path:
+    """Return the index cache directory (defaults to .git/bm25s-cache)."""
+    if cache_dir:
+        return Path(cache_dir)
+    return Path(git("rev-parse", "--git-dir").strip()) / CACHE_DIR_NAME
+
+
+def get_file_shas(file_paths: list[str]) -> dict[str, str]:
+    """Map each tracked path to its git blob SHA, including unstaged edits.
+
+    `git ls-files -s` gives the staged blob; files listed by `git diff` are
+    re-hashed from the working tree with `git hash-object`.
+    """
+    wanted = set(file_paths)
+    shas = {}
+    for line in git("ls-files", "-s", "-z").split("\0"):
+        if not line:
+            continue
+        meta, path = line.split("\t", 1)
+        if path in wanted:
+            shas[path] = meta.split()[1]
+
+    dirty = [
+        p for p in git("diff", "--name-only", "--relative", "-z").split("\0")
+        if p in shas
+    ]
+    dirty_existing = [p for p in dirty if Path(p).is_file()]
+    for p in dirty:
+        if p not in dirty_existing:
+            del shas[p]  # Deleted in the working tree
+    if dirty_existing:
+        result = subprocess.run(
+            ["git", "hash-object", "--stdin-paths"],
+            input="\n".join(os.path.abspath(p) for p in dirty_existing),
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        shas.update(zip(dirty_existing, result.stdout.split()))
+    return shas
+
+
+def get_index_key(shas: dict[str, str], config: dict) -> str:
+    """Hash the path -> blob SHA mapping and index config into a cache key."""
+    h = hashlib.sha256(json.dumps(config, sort_keys=True).encode())
+    for path in sorted(shas):
+        h.update(f"{path}\0{shas[path]}\n".encode())
+    return h.hexdigest()
+
+
+def prune_cache(cache_dir: Path, keep, limit: int = CACHE_KEEP):
+    """Remove all but the `limit` most recently used entries matching `keep`."""
+    entries = sorted(
+        (p for p in cache_dir.iterdir() if p.is_dir() and keep(p.name)),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for old in entries[limit:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def make_doc_table(store: dict) -> dict:
+    """Describe documents as indexes into a file list plus line ranges."""
+    file_ids = {}
+    doc_file = np.array(
+        [file_ids.setdefault(p, len(file_ids)) for p in store["paths"]],
+        dtype=np.int32
+    )
+    return {"files": list(file_ids), "doc_file": doc_file, "doc_lines": store["doc_lines"]}
+
+
+def load_cached_index(cache_dir: Path, key: str):
+    """Load a cached (retriever, docs) pair memory-mapped, or None on miss."""
+    entry = cache_dir / key
+    files_path = entry / "files.json"
+    if not files_path.exists():
+        return None
+    try:
+        retriever = bm25s.BM25.load(entry, mmap=True, show_progress=False)
+        docs = {
+            "files": json.loads(files_path.read_text()),
+            "doc_file": np.load(entry / "doc_file.npy", mmap_mode="r"),
+            "doc_lines": np.load(entry / "doc_lines.npy", mmap_mode="r"),
+        }
+    except Exception:
+        return None  # Corrupt or incompatible entry, rebuild
+    os.utime(entry)  # Mark as recently used for pruning
+    return retriever, docs
+
+
+def save_cached_index(cache_dir: Path, key: str, retriever, docs: dict):
+    """Atomically store an index under its key and prune old entries."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-"))
+    try:
+        retriever.save(tmp, show_progress=False)
+        np.save(tmp / "doc_file.npy", docs["doc_file"])
+        np.save(tmp / "doc_lines.npy", docs["doc_lines"])
+        (tmp / "files.json").write_text(json.dumps(docs["files"]))
+        os.rename(tmp, cache_dir / key)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # Another process won the race
+        return
+    prune_cache(cache_dir, lambda name: len(name) == 64)
+
+
+def empty_token_store(config: dict | None = None) -> dict:
+    """Return a token store with no documents."""
+    return {
+        "config": config,
+        "paths": [],
+        "shas": [],
+        "skipped": {},
+        "vocab": {},
+        "df": np.zeros(0, dtype=np.int64),
+        "doc_len": np.zeros(0, dtype=np.int32),
+        "doc_lines": np.zeros((0, 2), dtype=np.int32),
+        "post_tok": np.zeros(0, dtype=np.int32),
+        "post_tf": np.zeros(0, dtype=np.float32),
+        "post_off": np.zeros(1, dtype=np.int64),
+    }
+
+
+def get_store_dir(cache_dir: Path, config: dict) -> Path:
+    """Return the postings store directory for an index config."""
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+    return cache_dir / f"{STORE_DIR_PREFIX}{digest[:12]}"
+
+
+def load_token_store(cache_dir: Path, config: dict) -> dict:
+    """Load the per-document postings store, or an empty one on miss.
+
+    The store keeps, for every indexed document (a file, or a chunk of one),
+    its path, blob SHA, line range, length and (token id, term frequency)
+    postings, plus the global vocabulary and document frequencies, so
+    changed files can be patched in place.
+    """
+    store_dir = get_store_dir(cache_dir, config)
+    try:
+        meta = json.loads((store_dir / "meta.json").read_text())
+        store = {k: meta[k] for k in META_NAMES}
+        for name in ARRAY_NAMES:
+            store[name] = np.load(store_dir / f"{name}.npy")
+    except (OSError, ValueError, KeyError):
+        return empty_token_store(config)
+    return store
+
+
+def save_token_store(cache_dir: Path, store: dict):
+    """Replace the postings store on disk with `store`."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-"))
+    meta = {k: store[k] for k in META_NAMES}
+    (tmp / "meta.json").write_text(json.dumps(meta))
+    for name in ARRAY_NAMES:
+        np.save(tmp / f"{name}.npy", store[name])
+
+    store_dir = get_store_dir(cache_dir, store["config"])
+    old = Path(tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-"))
+    try:
+        if store_dir.exists():
+            os.replace(store_dir, old / store_dir.name)
+        os.rename(tmp, store_dir)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # Another process won the race
+    shutil.rmtree(old, ignore_errors=True)
+    prune_cache(cache_dir, lambda name: name.startswith(STORE_DIR_PREFIX))
+
+
+def read_text_file(file_path: str, max_file_size: int) -> tuple[str | None, int]:
+    """Read a file as UTF-8. Returns (text, bytes read).
+
+    The text is None if the file is too large, binary or unreadable.
+    Binaries are spotted like git does, by a NUL byte in the first block,
+    so they are rejected without reading or decoding the whole file.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size > max_file_size:
+                return None, 0
+            head = f.read(SNIFF_BYTES)
+            if b"\0" in head:
+                return None, len(head)
+            data = head + f.read()
+            return data.decode("utf-8"), len(data)
+    except (OSError, UnicodeDecodeError):
+        return None, 0
+
+
+def iter_corpus(file_paths: list[str], max_file_size: int, workers: int | None):
+    """Yield (paths, texts) batches read on a thread pool.
+
+    The next batch is read while the caller tokenizes the current one, so
+    at most two batches of file contents are held in memory. Unreadable
+    files come back with a text of None.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    batches = [
+        file_paths[i:i + READ_BATCH_SIZE]
+        for i in range(0, len(file_paths), READ_BATCH_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(batch):
+            return [pool.submit(read_text_file, p, max_file_size) for p in batch]
+
+        inflight = submit(batches[0]) if batches else []
+        for i, batch in enumerate(batches):
+            futures = inflight
+            inflight = submit(batches[i + 1]) if i + 1 < len(batches) else []
+            with profile_stage("read_wait"):
+                results = [f.result() for f in futures]
+            profile_count("files_read", len(batch))
+            profile_count("bytes_read", sum(n for _, n in results))
+            yield batch, [text for text, _ in results]
+
+
+def split_chunks(file_path: str, text: str, chunk_lines: int | None):
+    """Split a file into (start, end, text) documents with 1-based line ranges.
+
+    With `chunk_lines` unset the whole file is one document. Otherwise the
+    file is cut at top-level definitions (Python) or headings (markdown),
+    consecutive small sections are packed up to `chunk_lines` lines, and
+    longer sections are cut into fixed windows.
+    """
+    lines = text.splitlines(keepends=True)
+    if chunk_lines is None:
+        return [(1, max(1, len(lines)), text)]
+
+    boundary = BOUNDARIES.get(Path(file_path).suffix.lower())
+    starts = [0]
+    if boundary:
+        for i in range(1, len(lines)):
+            # Keep decorators attached to the definition that follows them
+            if boundary.match(lines[i]) and not lines[i - 1].startswith("@"):
+                starts.append(i)
+    sections = zip(starts, starts[1:] + [len(lines)])
+
+    chunks = []
+    pending = None  # (start, end) of sections packed so far
+    for start, end in sections:
+        if pending and end - pending[0] <= chunk_lines:
+            pending = (pending[0], end)
+            continue
+        if pending:
+            chunks.append(pending)
+            pending = None
+        while end - start > chunk_lines:
+            chunks.append((start, start + chunk_lines))
+            start += chunk_lines
+        if end > start:
+            pending = (start, end)
+    if pending:
+        chunks.append(pending)
+    return [(s + 1, e, "".join(lines[s:e])) for s, e in chunks]
+
+
+def identifier_tokens(identifier: str, stemmer, cache: dict) -> list[str]:
+    """Split an identifier into stemmed parts, keeping compounds whole too.
+
+    `getPendingSubphases` -> ["get", "pend", "subphas", "getpendingsubphases"].
+    Results are memoized in `cache` since identifiers repeat heavily.
+    """
+    tokens = cache.get(identifier)
+    if tokens is None:
+        parts = [p.lower() for p in SUBWORD.findall(identifier)]
+        words = [p for p in parts if len(p) > 1 and p not in bm25s.stopwords.STOPWORDS_EN]
+        tokens = stemmer.stemWords(words)
+        if len(parts) > 1:
+            tokens.append(identifier.lower())
+        cache[identifier] = tokens
+    return tokens
+
+
+def code_tokens(text: str, stemmer, cache: dict) -> list[str]:
+    """Tokenize source text with the code-aware tokenizer."""
+    tokens = []
+    for identifier in IDENTIFIER.findall(text):
+        tokens += identifier_tokens(identifier, stemmer, cache)
+    for identifier in DEFINITION.findall(text):
+        tokens += identifier_tokens(identifier, stemmer, cache) * DEFINITION_BOOST
+    return tokens
+
+
+def tokenize_corpus(texts: list[str], tokenizer: str, stemmer, cache: dict):
+    """Tokenize documents into (ids per document, token -> id vocab)."""
+    if tokenizer == "english":
+        tokenized = bm25s.tokenize(texts, stopwords="en", stemmer=stemmer, show_progress=False)
+        return tokenized.ids, tokenized.vocab
+
+    vocab = {}
+    ids = [
+        [vocab.setdefault(t, len(vocab)) for t in code_tokens(text, stemmer, cache)]
+        for text in texts
+    ]
+    return ids, vocab
+
+
+def tokenize_queries(queries: list[list[str]], tokenizer: str, stemmer) -> list[list[str]]:
+    """Tokenize query term lists the same way their index was tokenized."""
+    texts = [" ".join(terms) for terms in queries]
+    if tokenizer == "english":
+        return bm25s.tokenize(texts, stemmer=stemmer, return_ids=False, show_progress=False)
+    cache = {}
+    return [code_tokens(text, stemmer, cache) for text in texts]
+
+
+def update_token_store(
+    store: dict,
+    shas: dict[str, str],
+    stemmer,
+    config: dict,
+    workers: int | None = None,
+) -> dict:
+    """Re-tokenize only added or modified files and patch the statistics.
+
+    Postings of deleted or modified documents are dropped and their
+    contribution subtracted from the document frequencies; new postings are
+    appended and added. The vocabulary only grows, so when most of it has
+    become unused (or `config` changed) the store is rebuilt from scratch.
+    """
+    stale_vocab = np.count_nonzero(store["df"] == 0) > len(store["df"]) // 2
+    if store["config"] != config or stale_vocab:
+        store = empty_token_store(config)
+
+    # Drop documents whose blob changed or that are no longer tracked
+    keep = np.array(
+        [shas.get(p) == s for p, s in zip(store["paths"], store["shas"])],
+        dtype=bool
+    )
+    lengths = np.diff(store["post_off"])
+    post_keep = np.repeat(keep, lengths)
+    df = store["df"] - np.bincount(
+        store["post_tok"][~post_keep], minlength=len(store["df"])
+    )
+    paths = [p for p, k in zip(store["paths"], keep) if k]
+    doc_shas = [s for s, k in zip(store["shas"], keep) if k]
+    doc_len = [store["doc_len"][keep]]
+    doc_lines = [store["doc_lines"][keep]]
+    post_tok = [store["post_tok"][post_keep]]
+    post_tf = [store["post_tf"][post_keep]]
+    post_lengths = [lengths[keep]]
+
+    # Read and tokenize only what changed
+    known = dict(zip(paths, doc_shas))
+    skipped = {p: s for p, s in store["skipped"].items() if shas.get(p) == s}
+    to_read = [
+        p for p, s in shas.items()
+        if known.get(p) != s and skipped.get(p) != s
+    ]
+    vocab = dict(store["vocab"])
+    identifier_cache = {}
+    for batch, texts in iter_corpus(to_read, config["max_file_size"], workers):
+        corpus = []
+        valid_paths = []
+        for path, text in zip(batch, texts):
+            chunks = [] if text is None else split_chunks(path, text, config["chunk_lines"])
+            if not chunks:
+                skipped[path] = shas[path]  # Binary, oversized, unreadable or empty
+                profile_count("files_skipped")
+            for start, end, chunk in chunks:
+                corpus.append(chunk)
+                valid_paths.append(path)
+                doc_lines.append(np.array([[start, end]], dtype=np.int32))
+        if not corpus:
+            continue
+        with profile_stage("tokenize"):
+            batch_ids, batch_vocab = tokenize_corpus(
+                corpus, config["tokenizer"], stemmer, identifier_cache
+            )
+        del corpus
+        local_to_global = np.empty(len(batch_vocab), dtype=np.int32)
+        for token, local_id in batch_vocab.items():
+            local_to_global[local_id] = vocab.setdefault(token, len(vocab))
+        for doc_ids in batch_ids:
+            global_ids = local_to_global[np.asarray(doc_ids, dtype=np.int32)]
+            tok, tf = np.unique(global_ids, return_counts=True)
+            post_tok.append(tok.astype(np.int32))
+            post_tf.append(tf.astype(np.float32))
+            post_lengths.append(np.array([len(tok)]))
+            doc_len.append(np.array([len(doc_ids)], dtype=np.int32))
+        paths += valid_paths
+        doc_shas += [shas[p] for p in valid_paths]
+
+    # Postings hold unique tokens per document, so each one adds 1 to df
+    new_tok = np.concatenate(post_tok[1:] or [np.zeros(0, dtype=np.int32)])
+    df = np.pad(df, (0, len(vocab) - len(df))) + np.bincount(new_tok, minlength=len(vocab))
+    post_tok = np.concatenate(post_tok)
+    return {
+        "config": config,
+        "paths": paths,
+        "shas": doc_shas,
+        "skipped": skipped,
+        "vocab": vocab,
+        "df": df,
+        "doc_len": np.concatenate(doc_len).astype(np.int32),
+        "doc_lines": np.concatenate(doc_lines).astype(np.int32),
+        "post_tok": post_tok,
+        "post_tf": np.concatenate(post_tf),
+        "post_off": np.concatenate([[0], np.cumsum(np.concatenate(post_lengths))]).astype(np.int64),
+    }
+
+
+def build_retriever(store: dict):
+    """Build a BM25 retriever from stored postings with vectorized scoring.
+
+    Mirrors bm25s's default Lucene variant: idf = log(1 + (N - df + 0.5) /
+    (df + 0.5)) and tfc = tf / (k1 * (1 - b + b * dl / avgdl) + tf).
+    """
+    if not store["paths"]:
+        raise ValueError("No readable files found")
+
+    retriever = bm25s.BM25()
+    vocab = dict(store["vocab"])
+    if "" not in vocab:
+        vocab[""] = len(vocab)
+    n_vocab = len(vocab)
+    df = np.pad(store["df"], (0, n_vocab - len(store["df"])))
+
+    doc_len = store["doc_len"].astype(np.float32)
+    n_docs = len(doc_len)
+    idf = np.zeros(n_vocab, dtype=np.float32)
+    present = df > 0
+    idf[present] = np.log(1 + (n_docs - df[present] + 0.5) / (df[present] + 0.5))
+
+    tok = store["post_tok"]
+    tf = store["post_tf"]
+    post_doc = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(store["post_off"]))
+    k1, b = retriever.k1, retriever.b
+    norm = k1 * ((1 - b) + b * doc_len / (doc_len.mean() or 1.0))
+    scores = idf[tok] * tf / (norm[post_doc] + tf)
+
+    order = np.argsort(tok, kind="stable")
+    indptr = np.zeros(n_vocab + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tok, minlength=n_vocab), out=indptr[1:])
+    retriever.scores = {
+        "data": scores[order].astype(np.float32),
+        "indices": post_doc[order],
+        "indptr": indptr,
+        "num_docs": n_docs,
+    }
+    retriever.vocab_dict = vocab
+    retriever.nonoccurrence_array = None
+    retriever.unique_token_ids_set = set(vocab.values())
+    return retriever
+
+
+def merge_neighbouring_hits(hits: list[tuple], max_lines: int) -> list[tuple]:
+    """Merge (score, path, start, end) hits whose line ranges touch.
+
+    A merged span keeps the best score of its parts and never grows past
+    `max_lines`. Returns spans sorted by score, best first.
+    """
+    merged = []
+    for score, path, start, end in sorted(hits, key=lambda h: (h[1], h[2])):
+        if (
+            merged and merged[-1][1] == path
+            and start <= merged[-1][3] + 1
+            and end - merged[-1][2] < max_lines
+        ):
+            best, _, first, last = merged[-1]
+            merged[-1] = (max(best, score), path, first, max(last, end))
+        else:
+            merged.append((score, path, start, end))
+    return sorted(merged, key=lambda h: -h[0])
+
+
+def get_pathspecs(paths: list[str], include: list[str], exclude: list[str]) -> list[str]:
+    """Turn path prefixes and include/exclude globs into git pathspecs.
+
+    Git ORs positive pathspecs, so each prefix is combined with each
+    include glob. Globs use git's default matching, where `*` also matches
+    `/`, so `*.py` selects Python files at any depth.
+    """
+    specs = []
+    for prefix in [p.rstrip("/") for p in paths] or [""]:
+        if include:
+            specs += [f"{prefix}/{glob}" if prefix else glob for glob in include]
+        elif prefix:
+            specs.append(prefix)
+    specs += [f":(exclude){glob}" for glob in exclude]
+    return specs
+
+
+def list_files(pathspecs: list[str]) -> list[str]:
+    """List git-tracked files matching `pathspecs`, relative to the current directory."""
+    file_paths = [f for f in git("ls-files", "-z", "--", *pathspecs).split("\0") if f]
+    if not file_paths:
+        if pathspecs:
+            raise ValueError(f"No tracked files match {pathspecs}")
+        raise ValueError("No files found in git repository")
+    return file_paths
+
+
+def load_index(shas: dict[str, str], config: dict, cache_dir: Path | None, stemmer, workers: int | None = None):
+    """Load the cached index for these blob SHAs, or patch the postings store.
+
+    Returns (retriever, docs). With `cache_dir` None nothing is read from or
+    written to disk.
+    """
+    if cache_dir is None:
+        store = empty_token_store(config)
+    else:
+        key = get_index_key(shas, config)
+        with profile_stage("load_cache"):
+            cached = load_cached_index(cache_dir, key)
+        if cached:
+            profile_count("cache_hits")
+            return cached
+        with profile_stage("load_store"):
+            store = load_token_store(cache_dir, config)
+
+    with profile_stage("update_store"):
+        store = update_token_store(store, shas, stemmer, config, workers)
+    with profile_stage("build_index"):
+        retriever, docs = build_retriever(store), make_doc_table(store)
+    profile_count("docs_indexed", len(store["paths"]))
+    profile_count("postings", len(store["post_tok"]))
+    if cache_dir is not None:
+        with profile_stage("save_cache"):
+            save_token_store(cache_dir, store)
+            save_cached_index(cache_dir, key, retriever, docs)
+    return retriever, docs
+
+
+def score_queries(retriever, stemmer, queries: list[list[str]], tokenizer: str):
+    """Score every document for every query in one scatter-add.
+
+    Posting lists of all query tokens are gathered from the CSC score
+    matrix and summed into a (queries x documents) array with a single
+    `np.bincount`. Repeated query tokens count once per occurrence, as in
+    bm25s.
+    """
+    data = retriever.scores["data"]
+    indices = retriever.scores["indices"]
+    indptr = retriever.scores["indptr"]
+    n_docs = retriever.scores["num_docs"]
+    n_cols = len(indptr) - 1
+
+    query_tokens = tokenize_queries(queries, tokenizer, stemmer)
+    rows, spans = [], []
+    for qi, tokens in enumerate(query_tokens):
+        for token in tokens:
+            col = retriever.vocab_dict.get(token)
+            if col is not None and col < n_cols:
+                rows.append(qi)
+                spans.append((indptr[col], indptr[col + 1]))
+
+    positions = np.concatenate(
+        [np.arange(a, b) for a, b in spans] or [np.zeros(0, dtype=np.int64)]
+    )
+    lengths = [b - a for a, b in spans]
+    flat = np.repeat(np.asarray(rows, dtype=np.int64), lengths) * n_docs + indices[positions]
+    scores = np.bincount(flat, weights=data[positions], minlength=len(queries) * n_docs)
+    return scores.reshape(len(queries), n_docs)
+
+
+def search(retriever, docs: dict, stemmer, queries: list[list[str]], top_k: int, config: dict) -> list[list[tuple]]:
+    """Return (score, path, start, end) hits per query, best first."""
+    scores = score_queries(retriever, stemmer, queries, config["tokenizer"])
+    chunk_lines = config["chunk_lines"]
+
+    n_docs = scores.shape[1]
+    # Over-fetch chunks so neighbouring hits can be merged into one span
+    k = min(top_k * 3 if chunk_lines else top_k, n_docs)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+    results = []
+    for row, candidates in zip(scores, top):
+        hits = []
+        for doc_id in candidates[np.argsort(-row[candidates], kind="stable")]:
+            if row[doc_id] > 0:
+                start, end = docs["doc_lines"][doc_id]
+                hits.append((float(row[doc_id]), docs["files"][docs["doc_file"][doc_id]], int(start), int(end)))
+        if chunk_lines:
+            hits = merge_neighbouring_hits(hits, 2 * chunk_lines)[:top_k]
+        results.append(hits)
+    return results
+
+
+def get_socket_path(cache_dir: Path, config: dict) -> Path:
+    """Return the daemon socket for this working directory and index config.
+
+    Unix socket paths are limited to ~100 bytes, so deep checkouts fall back
+    to the temp directory.
+    """
+    ident = json.dumps({"cwd": os.getcwd(), **config}, sort_keys=True)
+    digest = hashlib.sha256(ident.encode()).hexdigest()[:12]
+    path = cache_dir / f"search-{digest}.sock"
+    if len(str(path)) > 100:
+        path = Path(tempfile.gettempdir()) / f"bm25s-search-{digest}.sock"
+    return path
+
+
+def query_daemon(socket_path: Path, request: dict) -> list[list[tuple]] | None:
+    """Send a query to a running daemon; None if there is none to ask."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_TIMEOUT)
+            sock.connect(str(socket_path))
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            response = json.loads(sock.makefile("rb").readline())
+    except (OSError, ValueError):
+        return None  # No daemon, stale socket or broken reply
+    if "error" in response:
+        return None
+    return [[tuple(hit) for hit in hits] for hits in response["results"]]
+
+
+def serve(socket_path: Path, config: dict, cache_dir: Path, workers: int | None, refresh_interval: float):
+    """Keep the index hot and answer queries over a Unix domain socket.
+
+    A background thread re-hashes the tree every `refresh_interval` seconds
+    and swaps in a new index when it changed, so queries never wait on git
+    or indexing. PyStemmer instances must not be used concurrently, so every
+    handler thread and the refresh thread get their own.
+    """
+    import socketserver
+    import threading
+
+    if query_daemon(socket_path, {"ping": True}) is not None:
+        print(f"A daemon is already serving {socket_path}", file=sys.stderr)
+        sys.exit(1)
+    socket_path.unlink(missing_ok=True)
+
+    import_backend()
+    local = threading.local()
+
+    def thread_stemmer():
+        if not hasattr(local, "stemmer"):
+            local.stemmer = Stemmer.Stemmer("english")
+        return local.stemmer
+
+    shas = get_file_shas(list_files(config["pathspecs"]))
+    state = {"key": get_index_key(shas, config), "index": load_index(shas, config, cache_dir, thread_stemmer(), workers)}
+
+    def refresh():
+        while True:
+            time.sleep(refresh_interval)
+            try:
+                shas = get_file_shas(list_files(config["pathspecs"]))
+                key = get_index_key(shas, config)
+                if key != state["key"]:
+                    state["index"] = load_index(shas, config, cache_dir, thread_stemmer(), workers)
+                    state["key"] = key
+            except Exception as e:
+                print(f"Index refresh failed: {e}", file=sys.stderr)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline())
+                if request.get("ping"):
+                    response = {"results": []}
+                else:
+                    retriever, docs = state["index"]
+                    results = search(
+                        retriever, docs, thread_stemmer(),
+                        request["queries"], request["top_k"], config
+                    )
+                    response = {"results": results}
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+    threading.Thread(target=refresh, daemon=True).start()
+    with socketserver.ThreadingUnixStreamServer(str(socket_path), Handler) as server:
+        server.daemon_threads = True
+        print(f"Serving {os.getcwd()} on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+def read_queries(source: str) -> list[dict]:
+    """Read JSONL queries from a file or "-" for stdin.
+
+    Each line is {"terms": [...] or "a b c", "id": optional, "top_k":
+    optional}; a bare JSON list or string is shorthand for its terms.
+    """
+    stream = sys.stdin if source == "-" else open(source)
+    queries = []
+    with stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            query = json.loads(line)
+            if not isinstance(query, dict):
+                query = {"terms": query}
+            terms = query["terms"]
+            if isinstance(terms, str):
+                terms = [terms]
+            query["terms"] = " ".join(terms).split()
+            queries.append(query)
+    return queries
+
+
+def format_jsonl(query: dict, hits: list[tuple], chunks: bool) -> str:
+    """Format one query's hits as a JSON line."""
+    results = []
+    for score, file_path, start, end in hits:
+        result = {"path": file_path, "score": round(score, 4)}
+        if chunks:
+            result.update(start=start, end=end)
+        results.append(result)
+    return json.dumps({"id": query["id"], "terms": query["terms"], "results": results})
+
+
+def print_hits(terms: list[str], hits: list[tuple], chunks: bool):
+    """Print hits in the human-readable result format."""
+    print(f"Terms: {terms}\n")
+    for score, file_path, start, end in hits:
+        if chunks:
+            print(f"{score:.2f}  {file_path}:{start}-{end}")
+        else:
+            print(f"{score:.2f}  {file_path}")
+
+    if not hits:
+        print("No results found. Try more general terms.")
 
 
 def main():
@@ -21,80 +839,193 @@ def main():
     parser.add_argument(
         "-t", "--term",
         action="append",
-        required=True,
         help="Search term (no spaces). Can be repeated: -t auth -t token"
     )
+    parser.add_argument(
+        "-q", "--query",
+        action="append",
+        help='Batch query: space-separated terms. Can be repeated: -q "auth token" -q "cache"'
+    )
+    parser.add_argument(
+        "--queries",
+        metavar="FILE",
+        help='JSONL file of batch queries ("-" for stdin), one {"terms": [...], "id": ...} per line'
+    )
     parser.add_argument(
         "-k", "--top-k",
         type=int,
         default=10,
         help="Number of results to return (default: 10)"
     )
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        nargs="?",
+        const=60,
+        default=None,
+        metavar="LINES",
+        help="Rank line-range chunks of up to LINES lines (default: 60) instead of whole files"
+    )
+    parser.add_argument(
+        "--tokenizer",
+        choices=["english", "code"],
+        default="english",
+        help="english: stemmed words (default). code: also splits camelCase/snake_case "
+             "identifiers, keeps whole identifiers and boosts names at definition sites"
+    )
+    parser.add_argument(
+        "--path",
+        action="append",
+        default=[],
+        help="Only search under this path prefix. Can be repeated"
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        help="Only search files matching this glob, e.g. '*.py'. Can be repeated"
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        help="Skip files matching this glob, e.g. '*.min.js'. Can be repeated"
+    )
+    parser.add_argument(
+        "--max-file-size",
+        type=int,
+        default=1_000_000,
+        help="Skip files larger than this many bytes (default: 1000000)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Threads used to read files (default: Python's thread pool default)"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Index cache directory (default: .git/bm25s-cache)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always rebuild the index and do not write the cache"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run a daemon that keeps the index in memory and answers queries on a Unix socket"
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=2.0,
+        help="Seconds between working-tree checks in --serve mode (default: 2)"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print per-stage timings, counts and peak memory as a JSON line on stderr "
+             "(or set SEARCH_PROFILE=1)"
+    )
+    parser.add_argument(
+        "--profile-out",
+        metavar="FILE",
+        help="Also dump cProfile stats to FILE (or set SEARCH_PROFILE_OUT)"
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Search in-process even if a daemon is running"
+    )
     args = parser.parse_args()
+    if args.chunks is not None and args.chunks < 1:
+        parser.error("--chunks LINES must be at least 1")
 
-    terms = args.term
+    terms = args.term or []
+    batch = bool(args.query or args.queries)
+    if terms and batch:
+        parser.error("use either -t terms or -q/--queries batch queries, not both")
+    if not terms and not batch and not args.serve:
+        parser.error("at least one -t/--term (or -q/--queries) is required")
 
     # Validate: each term must be a single word (no spaces)
     for term in terms:
         if " " in term:
             raise ValueError(f"Each term must be a single word without spaces. Got: '{term}'")
 
-    # Get files from git ls-files
-    result = subprocess.run(
-        ["git", "ls-files"],
-        capture_output=True,
-        text=True,
-        check=True
-    )
-    file_paths = [f for f in result.stdout.strip().split("\n") if f]
-
-    if not file_paths:
-        raise ValueError("No files found in git repository")
-
-    # Read file contents
-    corpus = []
-    valid_paths = []
-    for file_path in file_paths:
-        path = Path(file_path)
-        if path.is_file():
-            try:
-                content = path.read_text(encoding="utf-8")
-                corpus.append(content)
-                valid_paths.append(file_path)
-            except Exception:
-                pass  # Skip binary/unreadable files
+    if batch:
+        queries = [{"terms": q.split()} for q in args.query or []]
+        if args.queries:
+            queries += read_queries(args.queries)
+        for i, query in enumerate(queries):
+            query.setdefault("id", i)
+    else:
+        queries = [{"terms": terms}]
+    top_k = max(q.get("top_k", args.top_k) for q in queries) if queries else args.top_k
 
-    if not corpus:
-        raise ValueError("No readable files found")
+    config = {
+        "max_file_size": args.max_file_size,
+        "chunk_lines": args.chunks,
+        "tokenizer": args.tokenizer,
+        "pathspecs": get_pathspecs(args.path, args.include, args.exclude),
+    }
+    cache_dir = None if args.no_cache else get_cache_dir(args.cache_dir)
 
-    # Index
-    stemmer = Stemmer.Stemmer("english")
-    corpus_tokens = bm25s.tokenize(corpus, stopwords="en", stemmer=stemmer)
-    retriever = bm25s.BM25()
-    retriever.index(corpus_tokens)
+    if args.serve:
+        if cache_dir is None:
+            parser.error("--serve needs the index cache; drop --no-cache")
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        serve(get_socket_path(cache_dir, config), config, cache_dir, args.workers, args.refresh_interval)
+        return
 
-    # Search
-    query = " ".join(terms)
-    query_tokens = bm25s.tokenize(query, stemmer=stemmer)
+    if not queries:
+        return
 
-    k = min(args.top_k, len(valid_paths))
-    results, scores = retriever.retrieve(query_tokens, corpus=valid_paths, k=k)
+    PROFILE["enabled"] = args.profile or bool(os.environ.get("SEARCH_PROFILE"))
+    profile_out = args.profile_out or os.environ.get("SEARCH_PROFILE_OUT")
+    profiler = None
+    if profile_out:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
 
-    print(f"Terms: {terms}\n")
-    found = 0
-    for i in range(results.shape[1]):
-        result = results[0, i]
-        score = scores[0, i]
-        if score > 0:
-            if isinstance(result, dict):
-                file_path = result.get("text", str(result))
-            else:
-                file_path = str(result)
-            print(f"{score:.2f}  {file_path}")
-            found += 1
+    try:
+        with profile_stage("total"):
+            # Ask a running daemon first; fall back to searching in-process
+            term_lists = [q["terms"] for q in queries]
+            results = None
+            if cache_dir is not None and not args.no_daemon:
+                request = {"queries": term_lists, "top_k": top_k}
+                with profile_stage("daemon_query"):
+                    results = query_daemon(get_socket_path(cache_dir, config), request)
+            if results is None:
+                with profile_stage("import"):
+                    import_backend()
+                stemmer = Stemmer.Stemmer("english")
+                with profile_stage("list_files"):
+                    file_paths = list_files(config["pathspecs"])
+                with profile_stage("hash_files"):
+                    shas = get_file_shas(file_paths)
+                profile_count("files_listed", len(file_paths))
+                retriever, docs = load_index(shas, config, cache_dir, stemmer, args.workers)
+                with profile_stage("search"):
+                    results = search(retriever, docs, stemmer, term_lists, top_k, config)
+            profile_count("queries", len(term_lists))
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_out)
+        if PROFILE["enabled"]:
+            emit_profile()
 
-    if found == 0:
-        print("No results found. Try more general terms.")
+    if not batch:
+        print_hits(terms, results[0][:args.top_k], bool(args.chunks))
+        return
+    for query, hits in zip(queries, results):
+        print(format_jsonl(query, hits[:query.get("top_k", args.top_k)], bool(args.chunks)))
 
 
 if __name__ == "__main__":
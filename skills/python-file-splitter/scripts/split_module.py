@@ -5,13 +5,22 @@ Split large Python modules into packages.
 Usage:
     python split_module.py parse <file.py>
     python split_module.py split <file.py> <groupings.json> <module> <Name1> <Name2> ...
+    python split_module.py suggest <file.py> [-o groupings.json]
+    python split_module.py split-many <manifest.json>
 """
 
 import argparse
+import ast
+import contextlib
+import io
 import json
+import os
+import re
 import subprocess
 import sys
 import shutil
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 
@@ -26,8 +35,219 @@ def run_ast_grep(pattern: str, file_path: str) -> list:
     return json.loads(result.stdout)
 
 
-def parse_definitions(file_path: str) -> list[dict]:
+def node_span(node: ast.stmt) -> tuple[int, int]:
+    """0-based (start, end) lines of a statement, including its decorators."""
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    return start - 1, node.end_lineno - 1
+
+
+def target_names(target: ast.expr) -> list[str] | None:
+    """Names a plain or unpacking assignment target binds; None if it stores into something else."""
+    if isinstance(target, ast.Name):
+        return [target.id]
+    if isinstance(target, ast.Starred):
+        return target_names(target.value)
+    if isinstance(target, (ast.Tuple, ast.List)):
+        names = []
+        for element in target.elts:
+            element_names = target_names(element)
+            if element_names is None:
+                return None
+            names += element_names
+        return names
+    return None  # Subscript or Attribute: mutates an existing object
+
+
+def assignment_names(node: ast.stmt) -> list[str]:
+    """Names bound by a top-level assignment statement.
+
+    Empty if any target is a subscript or attribute (HANDLERS["a"] = a,
+    Foo.attr = x): those modify another definition and are statements.
+    """
+    if isinstance(node, ast.Assign):
+        targets = node.targets
+    elif isinstance(node, (ast.AnnAssign, ast.AugAssign)):
+        targets = [node.target]
+    elif getattr(ast, "TypeAlias", None) and isinstance(node, ast.TypeAlias):
+        targets = [node.name]
+    else:
+        return []
+    names = []
+    for target in targets:
+        bound = target_names(target)
+        if bound is None:
+            return []
+        names += [n for n in bound if n not in names]
+    return names
+
+
+def is_import_block(node: ast.stmt) -> bool:
+    """Imports, or a try/if whose branches only import (and set fallbacks), e.g. optional dependencies."""
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return True
+    if isinstance(node, (ast.Try, ast.If)):
+        branches = [node.body, node.orelse] + [h.body for h in getattr(node, "handlers", [])]
+        statements = [n for branch in branches for n in branch]
+        return any(isinstance(n, (ast.Import, ast.ImportFrom)) for n in statements) and all(
+            is_import_block(n) or isinstance(n, (ast.Assign, ast.Pass)) for n in statements
+        )
+    return False
+
+
+def describe_import(node: ast.stmt, start: int, end: int) -> dict:
+    """An import span plus the names it binds, for writing per-file imports.
+
+    Plain import/from-import statements record one (bound name, alias text)
+    pair per alias so they can be re-emitted name by name; try/if import
+    blocks and star imports can only be copied whole.
+    """
+    entry = {"start": start, "end": end}
+    if isinstance(node, ast.ImportFrom):
+        if any(a.name == "*" for a in node.names):
+            entry["kind"] = "star"
+            return entry
+        # Split files live one package level deeper, so relative imports need one more dot
+        dots = "." * (node.level + 1) if node.level else ""
+        entry["kind"] = "future" if node.module == "__future__" else "from"
+        entry["prefix"] = f"from {dots}{node.module or ''} import "
+        entry["aliases"] = [
+            (a.asname or a.name, f"{a.name} as {a.asname}" if a.asname else a.name) for a in node.names
+        ]
+    elif isinstance(node, ast.Import):
+        entry["kind"] = "import"
+        entry["aliases"] = [
+            (a.asname or a.name.split(".")[0], f"{a.name} as {a.asname}" if a.asname else a.name)
+            for a in node.names
+        ]
+    else:
+        entry["kind"] = "block"
+        # Names the block itself reads, like TYPE_CHECKING or sys in its condition
+        entry["requires"] = sorted({n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)})
+        entry["names"] = sorted(
+            {(a.asname or a.name.split(".")[0]) for n in ast.walk(node) if isinstance(n, (ast.Import, ast.ImportFrom)) for a in n.names}
+            | {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)}
+        )
+    return entry
+
+
+def import_names(entry: dict) -> list[str]:
+    return entry.get("names") or [bound for bound, _ in entry.get("aliases", [])]
+
+
+def parse_module_ast(file_path: str) -> dict:
+    """Walk the module once with the stdlib ast.
+
+    Returns {"definitions": [...], "imports": [...], "statements": [...],
+    "docstring": (start, end) or None}. Definitions are top-level classes,
+    functions (incl. async) and assignments, with spans that include
+    decorators; assignments to UPPER_CASE names are "constant". Each
+    definition lists in "uses" the module-level names (imports and other
+    definitions) it references. "statements" are the remaining top-level
+    statements, such as setup calls.
+    """
+    source = Path(file_path).read_text()
+    tree = ast.parse(source, filename=file_path)
+
+    definitions = []
+    imports = []
+    statements = []
+    docstring = None
+    by_name = {}
+    nodes = {}
+    for index, node in enumerate(tree.body):
+        start, end = node_span(node)
+        if is_import_block(node):
+            imports.append(describe_import(node, start, end))
+            continue
+        if index == 0 and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            docstring = (start, end)
+            continue
+
+        if isinstance(node, ast.ClassDef):
+            bases = [ast.unparse(b) for b in node.bases]
+            d = {"name": node.name, "kind": "class", "start": start, "end": end, "parent": bases[0] if bases else None}
+            if len(bases) > 1:
+                d["bases"] = bases
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            d = {"name": node.name, "kind": "function", "start": start, "end": end}
+        else:
+            names = assignment_names(node)
+            if not names:
+                statements.append({"start": start, "end": end})
+                nodes[id(statements[-1])] = [node]
+                continue
+            kind = "constant" if all(n.isupper() for n in names) else "assignment"
+            d = {"name": names[0], "kind": kind, "start": start, "end": end}
+            if len(names) > 1:
+                d["names"] = names
+        decorators = [ast.unparse(dec) for dec in getattr(node, "decorator_list", [])]
+        if decorators:
+            d["decorators"] = decorators
+
+        # Same name again: merge adjacent redefinitions (@overload stubs,
+        # property-style re-binding); a later one elsewhere is a statement
+        # that split places in the file the name moves to
+        previous = by_name.get(d["name"])
+        if previous is not None:
+            if previous is definitions[-1] and not (statements and statements[-1]["start"] > previous["start"]):
+                previous["end"] = end
+                nodes[id(previous)].append(node)
+            else:
+                statements.append({"start": start, "end": end, "names": d.get("names", [d["name"]])})
+                nodes[id(statements[-1])] = [node]
+            continue
+        by_name[d["name"]] = d
+        nodes[id(d)] = [node]
+        definitions.append(d)
+
+    module_names = {n for i in imports for n in import_names(i)}
+    module_names |= {n for d in definitions for n in d.get("names", [d["name"]])}
+    for entry in definitions + statements:
+        referenced = {
+            n.id for node in nodes[id(entry)] for n in ast.walk(node)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)
+        }
+        entry["uses"] = sorted(referenced & module_names - set(entry.get("names", [entry.get("name")])))
+
+    return {"definitions": definitions, "imports": imports, "statements": statements, "docstring": docstring}
+
+
+def parse_module_ast_grep(file_path: str) -> dict:
+    """Fallback parser using ast-grep patterns (classes, functions and imports only)."""
+    imports = []
+    for pattern in ("import $$$NAMES", "from $MODULE import $$$NAMES"):
+        for r in run_ast_grep(pattern, file_path):
+            if r["range"]["start"]["column"] != 0:
+                continue
+            imports.append({"start": r["range"]["start"]["line"], "end": r["range"]["end"]["line"]})
+    imports.sort(key=lambda i: i["start"])
+    return {"definitions": parse_definitions_ast_grep(file_path), "imports": imports}
+
+
+def parse_module(file_path: str, backend: str = "auto") -> dict:
+    """Parse a module with the chosen backend.
+
+    "auto" uses the stdlib ast, falling back to ast-grep (if installed)
+    when the file doesn't parse with this Python version.
+    """
+    if backend == "ast-grep":
+        return parse_module_ast_grep(file_path)
+    try:
+        return parse_module_ast(file_path)
+    except SyntaxError as e:
+        if backend == "ast" or not shutil.which("ast-grep"):
+            raise
+        print(f"ast could not parse {file_path} ({e}); falling back to ast-grep", file=sys.stderr)
+        return parse_module_ast_grep(file_path)
+
+
+def parse_definitions(file_path: str, backend: str = "auto") -> list[dict]:
     """Extract all top-level definitions from a Python file."""
+    return parse_module(file_path, backend)["definitions"]
+
+
+def parse_definitions_ast_grep(file_path: str) -> list[dict]:
+    """Extract top-level classes and functions with ast-grep."""
     definitions = []
     seen_classes = set()
 
@@ -117,12 +337,107 @@ def parse_definitions(file_path: str) -> list[dict]:
     return definitions
 
 
-def cmd_parse(file_path: str):
+def cmd_parse(file_path: str, backend: str = "auto"):
     """Print definitions JSON to stdout."""
-    print(json.dumps(parse_definitions(file_path), indent=2))
+    print(json.dumps(parse_definitions(file_path, backend), indent=2))
+
 
+def import_lines(imports: list[dict], needed: set[str], lines: list[str]) -> list[str]:
+    """The import statements a generated file needs for the names it uses.
 
-def cmd_write(file_path: str, groupings_path: str):
+    __future__ and star imports are always kept; import blocks are copied
+    whole if any name they bind is needed; other statements are reduced to
+    the needed names.
+    """
+    needed = set(needed)
+    for entry in imports:
+        if entry["kind"] == "block" and needed & set(entry["names"]):
+            needed |= set(entry["requires"])
+    out = []
+    for entry in imports:
+        kind = entry["kind"]
+        if kind in ("future", "star"):
+            if kind == "star":
+                out.append("".join(lines[entry["start"]:entry["end"] + 1]).rstrip("\n"))
+            else:
+                out.append(entry["prefix"] + ", ".join(text for _, text in entry["aliases"]))
+        elif kind == "block":
+            if needed & set(entry["names"]):
+                out.append("".join(lines[entry["start"]:entry["end"] + 1]).rstrip("\n"))
+        else:
+            parts = [text for bound, text in entry["aliases"] if bound in needed]
+            if kind == "from" and parts:
+                out.append(entry["prefix"] + ", ".join(parts))
+            elif kind == "import":
+                out.extend(f"import {text}" for text in parts)
+    return out
+
+
+def find_import_cycles(edges: dict[str, set[str]]) -> list[list[str]]:
+    """Cycles in the generated files' intra-package imports."""
+    cycles, state, stack = [], {}, []
+
+    def visit(node):
+        state[node] = "active"
+        stack.append(node)
+        for dep in sorted(edges.get(node, ())):
+            if state.get(dep) == "active":
+                cycles.append(stack[stack.index(dep):] + [dep])
+            elif dep not in state:
+                visit(dep)
+        stack.pop()
+        state[node] = "done"
+
+    for node in sorted(edges):
+        if node not in state:
+            visit(node)
+    return cycles
+
+
+def lazy_init(stem: str, exports: dict[str, str], header: list[str], extras: list[str] = ()) -> str:
+    """A package __init__ that imports submodules on first attribute access (PEP 562).
+
+    `exports` maps each re-exported name to its submodule. Type checkers and
+    IDEs see the same names through the TYPE_CHECKING imports. `header` holds
+    the eager imports init_extras need, since module __getattr__ is not
+    consulted for the module's own global lookups. `extras` are the names
+    init_extras bind; with the public exports they make up __all__, as a
+    plain star import would.
+    """
+    by_module = {}
+    for name, module in exports.items():
+        by_module.setdefault(module, []).append(name)
+
+    out = [f'"""{stem} package."""', ""]
+    if header and header[0].startswith("from __future__"):
+        out.append(header.pop(0))
+    out += ["import importlib", "from typing import TYPE_CHECKING"]
+    out += header
+    out += ["", "if TYPE_CHECKING:"]
+    out += [f"    from .{module} import {', '.join(names)}" for module, names in by_module.items()] or ["    pass"]
+    out += ["", "_EXPORTS = {"]
+    out += [f"    {name!r}: {module!r}," for name, module in exports.items()]
+    public = [name for name in [*exports, *extras] if not name.startswith("_")]
+    out += ["}", f"__all__ = {public!r}", ""]
+    out += [
+        "",
+        "def __getattr__(name):",
+        "    module = _EXPORTS.get(name)",
+        "    if module is None:",
+        '        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")',
+        '    value = getattr(importlib.import_module(f".{module}", __name__), name)',
+        "    globals()[name] = value",
+        "    return value",
+        "",
+        "",
+        "def __dir__():",
+        "    return sorted(set(globals()) | set(_EXPORTS))",
+        "",
+    ]
+    return "\n".join(out) + "\n"
+
+
+def cmd_write(file_path: str, groupings_path: str, backend: str = "auto", lazy: bool = False):
     """
     Write split files based on groupings JSON.
     
@@ -134,6 +449,14 @@ def cmd_write(file_path: str, groupings_path: str):
         },
         "init_extras": ["factory_func"]
     }
+
+    With the ast backend, each file imports only the names its definitions
+    use, and definitions from sibling files explicitly (from .base import X).
+    The ast-grep backend has no usage data, so base.py gets the whole import
+    section and the other files star-import base.
+
+    With lazy, __init__.py loads each submodule on first access to one of
+    its names instead of importing them all up front.
     """
     source = Path(file_path)
     groupings = json.loads(Path(groupings_path).read_text())
@@ -141,8 +464,9 @@ def cmd_write(file_path: str, groupings_path: str):
     output_dir = source.parent / source.stem
     lines = source.read_text().splitlines(keepends=True)
     
-    # Parse to get line ranges
-    definitions = {d["name"]: d for d in parse_definitions(file_path)}
+    # Parse once to get line ranges of definitions and imports
+    module = parse_module(file_path, backend)
+    definitions = {d["name"]: d for d in module["definitions"]}
     
     def extract(name):
         if name not in definitions:
@@ -151,54 +475,216 @@ def cmd_write(file_path: str, groupings_path: str):
         return "".join(lines[d["start"]:d["end"] + 1])
     
     def find_imports_end():
-        last_import_line = 0
-        # Find all "import x" statements at module level (column 0)
-        for r in run_ast_grep("import $$$NAMES", file_path):
-            if r["range"]["start"]["column"] != 0:
-                continue
-            end_line = r["range"]["end"]["line"]
-            if end_line > last_import_line:
-                last_import_line = end_line
-        # Find all "from x import y" statements at module level (column 0)
-        for r in run_ast_grep("from $MODULE import $$$NAMES", file_path):
-            if r["range"]["start"]["column"] != 0:
-                continue
-            end_line = r["range"]["end"]["line"]
-            if end_line > last_import_line:
-                last_import_line = end_line
-        return last_import_line + 1
-    
+        return max((i["end"] for i in module["imports"]), default=-1) + 1
+
+    def by_line(names):
+        return sorted(names, key=lambda n: definitions.get(n, {}).get("start", 0))
+
+    files = {"base": by_line(groupings.get("base", []))}
+    for group_name, members in groupings.get("groups", {}).items():
+        files[group_name] = by_line(members)
+    files["__init__"] = list(groupings.get("init_extras", []))
+
+    # Which file each module-level name ends up in
+    owner = {}
+    for file_name, members in files.items():
+        for name in members:
+            for bound in definitions.get(name, {}).get("names", [name]):
+                owner[bound] = file_name
+
+    minimal = "uses" in next(iter(definitions.values()), {"uses": []})
+    if minimal:
+        # Importing from the package's own __init__ is circular, so init_extras
+        # that other files use move to base (with any init_extras they use)
+        moved = True
+        while moved:
+            moved = False
+            for name in [n for n in files["__init__"] if n in definitions]:
+                bound = set(definitions[name].get("names", [name]))
+                users = sorted({
+                    f for f, members in files.items() if f != "__init__"
+                    for n in members if n in definitions and bound & set(definitions[n]["uses"])
+                })
+                if not users:
+                    continue
+                groups = sorted({owner.get(u) for u in definitions[name]["uses"]} - {None, "base", "__init__"})
+                if groups:
+                    raise SystemExit(
+                        f"init_extras {name} is used by {', '.join(users)} but uses names from "
+                        f"{', '.join(groups)}; move it to one of those groups in the groupings."
+                    )
+                print(f"NOTE: moving init_extras {name} to base: used by {', '.join(users)}", file=sys.stderr)
+                files["__init__"].remove(name)
+                files["base"] = by_line(files["base"] + [name])
+                for b in bound:
+                    owner[b] = "base"
+                moved = True
+
+    # Re-exported names, in source order, and the submodule each lives in
+    exports = {}
+    for name in by_line(definitions):
+        if owner.get(name) not in (None, "__init__"):
+            for bound in definitions[name].get("names", [name]):
+                exports[bound] = owner[name]
+
+    extras = [bound for name in files["__init__"] for bound in definitions.get(name, {}).get("names", [name])]
+
     # Setup
     if output_dir.exists():
         shutil.rmtree(output_dir)
     output_dir.mkdir()
-    
-    imports_section = "".join(lines[:find_imports_end()])
-    
-    # base.py - sort by source line order
-    base_content = imports_section + "\n"
-    base_names = sorted(groupings.get("base", []), key=lambda n: definitions.get(n, {}).get("start", 0))
-    for name in base_names:
-        base_content += "\n" + extract(name) + "\n"
-    (output_dir / "base.py").write_text(base_content)
-    print(f"Wrote {output_dir / 'base.py'}")
-    
-    # group files
-    for group_name, members in groupings.get("groups", {}).items():
-        content = f'"""Module for {group_name}."""\n\nfrom .base import *\n\n'
-        for name in sorted(members, key=lambda n: definitions.get(n, {}).get("start", 0)):
-            content += extract(name) + "\n\n"
-        (output_dir / f"{group_name}.py").write_text(content)
-        print(f"Wrote {output_dir / group_name}.py")
-    
-    # __init__.py
-    init_content = f'"""{source.stem} package."""\n\nfrom .base import *\n'
-    for group_name in groupings.get("groups", {}):
-        init_content += f"from .{group_name} import *\n"
-    for name in groupings.get("init_extras", []):
-        init_content += "\n" + extract(name) + "\n"
-    (output_dir / "__init__.py").write_text(init_content)
-    print(f"Wrote {output_dir / '__init__.py'}")
+
+    if minimal:
+        # Setup statements interleaved with the imports (e.g. sys.path tweaks) stay in base.py
+        preamble = [st for st in module["statements"] if st["start"] < find_imports_end()]
+
+        # Later statements (registrations, Foo.attr = x) go after the last
+        # definition they use, in that definition's file; the rest go to base
+        defined = {}
+        for d in definitions.values():
+            for bound in d.get("names", [d["name"]]):
+                defined[bound] = d
+        placed = {file_name: [] for file_name in files}
+        for st in module["statements"]:
+            if st in preamble:
+                continue
+            deps = [defined[u] for u in st["uses"] if u in defined]
+            missing = sorted(u for u in st["uses"] if u in defined and u not in owner)
+            if missing:
+                raise SystemExit(
+                    f"Top-level statement at line {st['start'] + 1} uses {', '.join(missing)}, "
+                    "which the groupings leave out; add them to the groupings."
+                )
+            last = max(deps, key=lambda d: d["start"], default=None)
+            rebound = [owner[n] for n in st.get("names", []) if n in owner]
+            if rebound:
+                # A later re-binding has to replace the name where it now lives
+                placed[rebound[0]].append(st)
+            elif any(owner[d["name"]] == "__init__" for d in deps):
+                # Nothing may import from __init__, so it has to run there
+                placed["__init__"].append(st)
+            else:
+                placed[owner[last["name"]] if last else "base"].append(st)
+
+        if lazy:
+            # A submodule that registers into another file's state at import
+            # (@register, registry["x"] = X) only does so once something loads it
+            deferred = []
+            for file_name in files:
+                if file_name == "__init__":
+                    continue
+                for name in files[file_name]:
+                    d = definitions.get(name, {})
+                    for dec in d.get("decorators", []):
+                        used = {n.id for n in ast.walk(ast.parse(dec, mode="eval")) if isinstance(n, ast.Name)}
+                        if any(owner.get(u) not in (None, file_name) for u in used):
+                            deferred.append(f"{name} (@{dec}) in {file_name}")
+                for st in placed[file_name]:
+                    if any(owner.get(u) not in (None, file_name) for u in st["uses"]):
+                        deferred.append(f"the statement at line {st['start'] + 1} in {file_name}")
+            if deferred:
+                raise SystemExit(
+                    "--lazy would defer these side effects until their file is first accessed: "
+                    f"{'; '.join(deferred)}. Split without --lazy."
+                )
+
+        def body(file_name):
+            """Definition names and placed statements of a file, in source order."""
+            items = [(definitions[n]["start"], n) for n in files[file_name] if n in definitions]
+            items += [(st["start"], st) for st in placed[file_name]]
+            items += [(-1, n) for n in files[file_name] if n not in definitions]
+            return [item for _, item in sorted(items, key=lambda item: item[0])]
+
+        def chunk(item):
+            if isinstance(item, str):
+                return extract(item)
+            return "".join(lines[item["start"]:item["end"] + 1])
+
+        edges = {}
+        contents = {}
+        for file_name in files:
+            members = body(file_name)
+            found = [item for item in members if not isinstance(item, str) or item in definitions]
+            uses = {u for item in found for u in (item if isinstance(item, dict) else definitions[item])["uses"]}
+            if file_name == "base":
+                uses |= {u for st in preamble for u in st["uses"]}
+
+            siblings = {}
+            if file_name == "__init__" and not lazy:
+                # Re-export every definition from the file it moved to
+                for bound, other in exports.items():
+                    siblings.setdefault(other, []).append(bound)
+            else:
+                for name in sorted(uses):
+                    if owner.get(name) not in (None, file_name):
+                        siblings.setdefault(owner[name], []).append(name)
+                if file_name != "__init__":
+                    edges[file_name] = set(siblings) - {"__init__"}
+                elif siblings:
+                    print(f"NOTE: init_extras import {', '.join(sorted(siblings))} eagerly", file=sys.stderr)
+
+            header = import_lines(module["imports"], uses - set(owner), lines)
+            header += [f"from .{other} import {', '.join(names)}" for other, names in sorted(siblings.items())]
+            contents[file_name] = (header, members)
+
+        for cycle in find_import_cycles(edges):
+            print(f"WARNING: generated files import each other: {' -> '.join(cycle)}. "
+                  "Move the shared definitions to base.", file=sys.stderr)
+
+        for file_name, (header, members) in contents.items():
+            if file_name == "base":
+                doc = module["docstring"]
+                content = "".join(lines[doc[0]:doc[1] + 1]) + "\n" if doc else ""
+                if header:
+                    content += "\n".join(header) + "\n\n"
+                for st in preamble:
+                    content += "".join(lines[st["start"]:st["end"] + 1])
+                for item in members:
+                    content += "\n" + chunk(item) + "\n"
+            elif file_name == "__init__":
+                if lazy:
+                    content = lazy_init(source.stem, exports, header, extras)
+                else:
+                    content = f'"""{source.stem} package."""\n\n' + "\n".join(header) + "\n"
+                for item in members:
+                    content += "\n" + chunk(item) + "\n"
+            else:
+                content = f'"""Module for {file_name}."""\n\n' + "\n".join(header) + "\n\n"
+                for item in members:
+                    content += chunk(item) + "\n\n"
+            (output_dir / f"{file_name}.py").write_text(content)
+            print(f"Wrote {output_dir / file_name}.py")
+    else:
+        imports_section = "".join(lines[:find_imports_end()])
+
+        # base.py - sort by source line order
+        base_content = imports_section + "\n"
+        for name in files["base"]:
+            base_content += "\n" + extract(name) + "\n"
+        (output_dir / "base.py").write_text(base_content)
+        print(f"Wrote {output_dir / 'base.py'}")
+
+        # group files
+        for group_name in groupings.get("groups", {}):
+            content = f'"""Module for {group_name}."""\n\nfrom .base import *\n\n'
+            for name in files[group_name]:
+                content += extract(name) + "\n\n"
+            (output_dir / f"{group_name}.py").write_text(content)
+            print(f"Wrote {output_dir / group_name}.py")
+
+        # __init__.py
+        star_imports = ["from .base import *"] + [f"from .{g} import *" for g in groupings.get("groups", {})]
+        if lazy:
+            # Without usage data, init_extras can only get everything eagerly
+            print("WARNING: the ast-grep backend can't tell whether submodules register themselves "
+                  "on import; with --lazy that only happens on first access.", file=sys.stderr)
+            init_content = lazy_init(source.stem, exports, star_imports if files["__init__"] else [], extras)
+        else:
+            init_content = f'"""{source.stem} package."""\n\n' + "\n".join(star_imports) + "\n"
+        for name in files["__init__"]:
+            init_content += "\n" + extract(name) + "\n"
+        (output_dir / "__init__.py").write_text(init_content)
+        print(f"Wrote {output_dir / '__init__.py'}")
     
     # Convert original to re-export stub
     module_import = f"{source.parent.name}.{source.stem}"
@@ -206,6 +692,256 @@ def cmd_write(file_path: str, groupings_path: str):
     print(f"Updated {source} → re-export stub")
 
 
+# Only modules loaded at interpreter startup, so none of them is measured as free
+MEASURE_SCRIPT = """
+import sys, time
+failed = []
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    try:
+        __import__(name)
+    except Exception:
+        failed.append(name)
+print((time.perf_counter() - start) * 1000, *failed)
+"""
+
+
+def measure_import_times(module_sets: dict[str, set[str]]) -> dict[str, tuple[float, list[str]]]:
+    """Cold import time in ms of each set of modules, and the ones that fail to import.
+
+    Each set is imported together in one fresh interpreter, so dependencies
+    shared within a set count once. Sets are measured in parallel.
+    """
+    def measure(modules):
+        result = subprocess.run(
+            [sys.executable, "-c", MEASURE_SCRIPT, *sorted(modules)],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return 0.0, sorted(modules)
+        ms, *failed = result.stdout.splitlines()[-1].split()
+        return float(ms), failed
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool:
+        return dict(zip(module_sets, pool.map(measure, module_sets.values())))
+
+
+def cluster_definitions(definitions: list[dict], max_lines: int, rounds: int = 20) -> list[list[str]]:
+    """Group definitions by how much they reference each other.
+
+    Label propagation over the undirected reference graph: in source order,
+    each definition repeatedly joins the neighbouring cluster it has the
+    most reference weight to, as long as that cluster stays under
+    max_lines. Neighbours in the source get a weak edge, so unreferenced
+    helpers stay with the code they were written next to. Linear in the
+    number of references per round.
+    """
+    names = [d["name"] for d in definitions]
+    size = {d["name"]: d["end"] - d["start"] + 1 for d in definitions}
+    owner = {bound: d["name"] for d in definitions for bound in d.get("names", [d["name"]])}
+    weights = {name: {} for name in names}
+    for d in definitions:
+        for used in d["uses"]:
+            other = owner.get(used)
+            if other and other != d["name"]:
+                weights[d["name"]][other] = weights[d["name"]].get(other, 0) + 1
+                weights[other][d["name"]] = weights[other].get(d["name"], 0) + 1
+    for a, b in zip(names, names[1:]):
+        weights[a][b] = weights[a].get(b, 0) + 0.25
+        weights[b][a] = weights[b].get(a, 0) + 0.25
+
+    label = {name: i for i, name in enumerate(names)}
+    lines = dict(enumerate(size[name] for name in names))
+    for _ in range(rounds):
+        changed = False
+        for name in names:
+            current = label[name]
+            score = {}
+            for other, w in weights[name].items():
+                score[label[other]] = score.get(label[other], 0) + w
+            best, best_score = current, score.get(current, 0)
+            for candidate, w in sorted(score.items()):
+                if w > best_score and lines[candidate] + size[name] <= max_lines:
+                    best, best_score = candidate, w
+            if best != current:
+                lines[current] -= size[name]
+                lines[best] += size[name]
+                label[name] = best
+                changed = True
+        if not changed:
+            break
+
+    clusters = {}
+    for name in names:
+        clusters.setdefault(label[name], []).append(name)
+    return list(clusters.values())
+
+
+def strongly_connected(edges: dict[str, set[str]]) -> list[list[str]]:
+    """Tarjan's strongly connected components."""
+    index, low, stack, on_stack, components = {}, {}, [], set(), []
+
+    def visit(node):
+        index[node] = low[node] = len(index)
+        stack.append(node)
+        on_stack.add(node)
+        for dep in edges.get(node, ()):
+            if dep not in index:
+                visit(dep)
+                low[node] = min(low[node], low[dep])
+            elif dep in on_stack:
+                low[node] = min(low[node], index[dep])
+        if low[node] == index[node]:
+            component = []
+            while True:
+                member = stack.pop()
+                on_stack.discard(member)
+                component.append(member)
+                if member == node:
+                    break
+            components.append(component)
+
+    for node in list(edges):
+        if node not in index:
+            visit(node)
+    return components
+
+
+def snake_case(name: str) -> str:
+    return re.sub(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])", "_", name).lower().strip("_") or "group"
+
+
+def cmd_suggest(file_path: str, max_lines: int = 500, output: str | None = None, measure: bool = True):
+    """
+    Propose groupings.json from the definitions' reference graph.
+
+    Definitions used from more than one cluster go to base, together with
+    everything they use, so base never imports a group; a base over
+    max_lines is split the same way. Clusters that would import each other
+    are merged. Writes the groupings to `output` (or stdout) and a per-group
+    report to stderr, including the measured cold import cost of the
+    external modules each group pulls in.
+    """
+    module = parse_module(file_path, "ast")
+    definitions = module["definitions"]
+    by_name = {d["name"]: d for d in definitions}
+    owner = {bound: d["name"] for d in definitions for bound in d.get("names", [d["name"]])}
+    deps = {d["name"]: {owner[u] for u in d["uses"] if u in owner} - {d["name"]} for d in definitions}
+
+    def size(names):
+        return sum(by_name[n]["end"] - by_name[n]["start"] + 1 for n in names)
+
+    # Shared definitions, and their dependencies, go to base. A base over
+    # max_lines is clustered the same way, its shared core becoming the new
+    # base and the rest groups, until it fits or nothing is left to split
+    clusters = []
+    base = set(by_name)
+    while True:
+        found = cluster_definitions([d for d in definitions if d["name"] in base], max_lines)
+        group_of = {name: i for i, members in enumerate(found) for name in members}
+        users = {name: set() for name in base}
+        for name in base:
+            for other in deps[name]:
+                users[other].add(group_of[name])
+        shared = {name for name in base if len(users[name] - {group_of[name]}) > 1}
+        pending = list(shared)
+        while pending:
+            for dep in deps[pending.pop()] - shared:
+                shared.add(dep)
+                pending.append(dep)
+        if shared == base:
+            break
+        clusters += [[n for n in members if n not in shared] for members in found if set(members) - shared]
+        base = shared
+        if size(base) <= max_lines:
+            break
+    if size(base) > max_lines:
+        print(f"WARNING: base has {size(base)} lines (> {max_lines}) of definitions shared across groups; "
+              "split it by hand.", file=sys.stderr)
+    group_of = {name: i for i, members in enumerate(clusters) for name in members}
+    users = {name: set() for name in by_name}
+    for name, used in deps.items():
+        for other in used:
+            if name in group_of:
+                users[other].add(group_of[name])
+
+    # Merge clusters that would import each other
+    edges = {i: set() for i in range(len(clusters))}
+    for name, used in deps.items():
+        if name not in base:
+            edges[group_of[name]] |= {group_of[d] for d in used if d not in base} - {group_of[name]}
+    groups = []
+    for component in strongly_connected(edges):
+        members = [n for n in by_name if group_of.get(n) in component]
+        groups.append(members)
+        lines = size(members)
+        if len(component) > 1 and lines > max_lines:
+            print(f"WARNING: merged mutually dependent clusters into {lines} lines (> {max_lines}); "
+                  "break the cycle by hand or move shared code to base.", file=sys.stderr)
+    groups.sort(key=lambda members: by_name[members[0]]["start"])
+
+    # Name each group after its most referenced member
+    taken = {"base", "__init__"}
+    named = {}
+    for members in groups:
+        anchor = max(members, key=lambda n: (len(users[n]) + sum(n in deps[m] for m in members), -by_name[n]["start"]))
+        group_name = snake_case(anchor)
+        while group_name in taken:
+            group_name += "_"
+        taken.add(group_name)
+        named[group_name] = members
+
+    groupings = {
+        "base": [n for n in by_name if n in base],
+        "groups": named,
+        "init_extras": [],
+    }
+    text = json.dumps(groupings, indent=2)
+    if output:
+        Path(output).write_text(text + "\n")
+        print(f"Wrote {output}", file=sys.stderr)
+    else:
+        print(text)
+
+    # Report: size, sibling imports and predicted import cost per generated file
+    bound_module = {}
+    for entry in module["imports"]:
+        if entry["kind"] == "import":
+            for bound, alias_text in entry["aliases"]:
+                bound_module[bound] = alias_text.split(" as ")[0]
+        elif entry["kind"] == "from" and not entry["prefix"].startswith("from ."):
+            for bound, _ in entry["aliases"]:
+                bound_module[bound] = entry["prefix"].split()[1]
+    files = {"base": groupings["base"], **named}
+    file_of = {n: f for f, members in files.items() for n in members}
+    external = {
+        f: {bound_module[u] for n in members for u in by_name[n]["uses"] if u in bound_module}
+        for f, members in files.items()
+    }
+    imports = {f: {file_of[d] for n in members for d in deps[n]} - {f} for f, members in files.items()}
+    pulled = {}
+    for f in files:
+        closure, pending = {f}, [f]
+        while pending:
+            for other in imports[pending.pop()] - closure:
+                closure.add(other)
+                pending.append(other)
+        pulled[f] = set().union(*(external[c] for c in closure))
+    times = measure_import_times(pulled) if measure else {}
+
+    for f, members in files.items():
+        modules = pulled[f]
+        report = f"{f:<24} {len(members):>4} defs {size(members):>6} lines"
+        if imports[f]:
+            report += f"  imports {', '.join(sorted(imports[f]))}"
+        if measure:
+            cost, failed = times[f]
+            report += f"  ~{cost:.1f} ms import ({len(modules)} external modules)"
+            if failed:
+                report += f", not importable here: {', '.join(failed)}"
+        print(report, file=sys.stderr)
+
+
 def get_backup_path(file_path: str) -> Path:
     """Get the backup file path for a source file."""
     source = Path(file_path)
@@ -261,6 +997,119 @@ def cmd_test_imports(module: str, *names: str):
     print(f"OK: {import_stmt}")
 
 
+VERIFY_SCRIPT = """
+import json, sys, time, traceback
+for module, names in json.load(sys.stdin):
+    start = time.perf_counter()
+    try:
+        exec(f"from {module} import {', '.join(names)}", {})
+        result = {"module": module, "ok": True}
+    except BaseException:
+        result = {"module": module, "ok": False, "error": traceback.format_exc()}
+    result["ms"] = (time.perf_counter() - start) * 1000
+    print(json.dumps(result), flush=True)
+"""
+
+
+def cmd_test_imports_many(checks: list[tuple[str, list[str]]]) -> list[dict]:
+    """Test several `from module import names` in one interpreter.
+
+    Returns one {"module", "ok", "ms"[, "error"]} per check, in order. The
+    time includes dependencies not already loaded by an earlier module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", VERIFY_SCRIPT],
+        input=json.dumps(checks), capture_output=True, text=True
+    )
+    results = [json.loads(line) for line in result.stdout.splitlines() if line.startswith("{")]
+    # The interpreter died part way (e.g. a segfault or os._exit in module code)
+    for module, _ in checks[len(results):]:
+        results.append({"module": module, "ok": False, "ms": 0.0, "error": result.stderr or "verifier exited early"})
+    return results
+
+
+def write_one(entry: dict, backend: str, lazy: bool) -> tuple[bool, str]:
+    """Back up and split one manifest entry in a worker. Returns (ok, captured output)."""
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            cmd_backup(entry["file"])
+            cmd_write(entry["file"], entry["groupings"], entry.get("backend", backend), entry.get("lazy", lazy))
+        return True, out.getvalue()
+    except SystemExit as e:
+        return False, out.getvalue() + f"{e}\n"
+    except Exception:
+        return False, out.getvalue() + traceback.format_exc()
+
+
+def cmd_split_many(manifest_path: str, backend: str = "auto", lazy: bool = False, jobs: int | None = None):
+    """
+    Split every module in a manifest, verify them together, roll back all on any failure.
+
+    Manifest format (lazy and backend default to the command-line flags):
+    [
+        {"file": "pkg/big.py", "groupings": "big.json", "module": "pkg.big",
+         "names": ["ClassA", "func_b"], "lazy": true}
+    ]
+    """
+    manifest = json.loads(Path(manifest_path).read_text())
+    files = [str(Path(e["file"]).resolve()) for e in manifest]
+    if len(set(files)) != len(files):
+        print("Manifest lists the same file more than once", file=sys.stderr)
+        sys.exit(1)
+
+    written = []
+    failed = False
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(write_one, entry, backend, lazy) for entry in manifest]
+            try:
+                for entry, future in zip(manifest, futures):
+                    try:
+                        ok, output = future.result()
+                    except Exception as e:  # e.g. BrokenProcessPool after a worker was killed
+                        ok, output = False, f"{e!r}\n"
+                    print(output, end="")
+                    # A worker can fail after the backup, so roll back whatever got backed up
+                    if get_backup_path(entry["file"]).exists():
+                        written.append(entry)
+                    if not ok:
+                        print(f"FAIL: writing {entry['file']}", file=sys.stderr)
+                        failed = True
+            except BaseException:
+                pool.shutdown(cancel_futures=True)
+                raise
+
+        if not failed:
+            results = cmd_test_imports_many([(e["module"], e["names"]) for e in manifest])
+            for entry, result in zip(manifest, results):
+                import_stmt = f"from {entry['module']} import {', '.join(entry['names'])}"
+                if result["ok"]:
+                    print(f"OK: {import_stmt} ({result['ms']:.1f} ms)")
+                else:
+                    print(f"FAIL: {import_stmt}", file=sys.stderr)
+                    print(result["error"], file=sys.stderr)
+                    failed = True
+    except BaseException:
+        # Interrupted, or verification itself raised: workers still running
+        # when that happened may have written too, so check every entry
+        pending = [e for e in manifest if get_backup_path(e["file"]).exists()]
+        print(f"Rolling back all {len(pending)} split(s)", file=sys.stderr)
+        for entry in pending:
+            cmd_rollback(entry["file"])
+        raise
+
+    if failed:
+        print(f"Rolling back all {len(written)} split(s)", file=sys.stderr)
+        for entry in written:
+            cmd_rollback(entry["file"])
+        sys.exit(1)
+
+    for entry in written:
+        get_backup_path(entry["file"]).unlink()
+    print(f"Split {len(written)} module(s)")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Split Python modules into packages")
     subparsers = parser.add_subparsers(dest="command", required=True)
@@ -268,6 +1117,10 @@ def main():
     # parse command
     parse_cmd = subparsers.add_parser("parse", help="Parse and print definitions")
     parse_cmd.add_argument("file", help="Python file to parse")
+    parse_cmd.add_argument(
+        "--backend", choices=["auto", "ast", "ast-grep"], default="auto",
+        help="Parser: stdlib ast, or ast-grep (auto = ast, falling back to ast-grep on syntax errors)",
+    )
 
     # split command
     split_cmd = subparsers.add_parser("split", help="Split file using groupings, test imports, rollback on failure")
@@ -275,17 +1128,54 @@ def main():
     split_cmd.add_argument("groupings", help="Path to groupings.json")
     split_cmd.add_argument("module", help="Module path for import test (e.g. package.module)")
     split_cmd.add_argument("names", nargs="+", help="Names to test importing")
+    split_cmd.add_argument(
+        "--backend", choices=["auto", "ast", "ast-grep"], default="auto",
+        help="Parser: stdlib ast, or ast-grep (auto = ast, falling back to ast-grep on syntax errors)",
+    )
+    split_cmd.add_argument(
+        "--lazy", action="store_true",
+        help="Generate an __init__.py that imports submodules on first use (PEP 562 __getattr__)",
+    )
+
+    # suggest command
+    suggest_cmd = subparsers.add_parser("suggest", help="Propose groupings.json from the reference graph")
+    suggest_cmd.add_argument("file", help="Python file to split")
+    suggest_cmd.add_argument(
+        "--max-lines", type=int, default=500,
+        help="Size cap per group in source lines (default: 500)",
+    )
+    suggest_cmd.add_argument("--output", "-o", default=None, help="Write groupings JSON here (default: stdout)")
+    suggest_cmd.add_argument(
+        "--no-measure", action="store_true",
+        help="Skip timing the external imports (one python -X importtime run per module)",
+    )
+
+    # split-many command
+    many_cmd = subparsers.add_parser(
+        "split-many", help="Split the modules in a manifest in parallel, verify together, rollback all on failure"
+    )
+    many_cmd.add_argument("manifest", help="JSON list of {file, groupings, module, names[, lazy, backend]}")
+    many_cmd.add_argument(
+        "--backend", choices=["auto", "ast", "ast-grep"], default="auto",
+        help="Parser for entries that don't set one (default: auto)",
+    )
+    many_cmd.add_argument("--lazy", action="store_true", help="Lazy __init__.py for entries that don't set lazy")
+    many_cmd.add_argument("--jobs", "-j", type=int, default=None, help="Worker processes (default: CPU count)")
 
     args = parser.parse_args()
 
     if args.command == "parse":
-        cmd_parse(args.file)
+        cmd_parse(args.file, args.backend)
+    elif args.command == "split-many":
+        cmd_split_many(args.manifest, args.backend, args.lazy, args.jobs)
+    elif args.command == "suggest":
+        cmd_suggest(args.file, args.max_lines, args.output, not args.no_measure)
     elif args.command == "split":
         cmd_backup(args.file)
-        cmd_write(args.file, args.groupings)
         try:
+            cmd_write(args.file, args.groupings, args.backend, args.lazy)
             cmd_test_imports(args.module, *args.names)
-        except SystemExit:
+        except BaseException:
             cmd_rollback(args.file)
             raise
         else: